@@ -0,0 +1,146 @@
+"""In-process stand-in for the VPN backend API used by the benchmarks.
+
+Implements the endpoints the bot calls (/users/, /servers/, /keys/ and
+their detail routes) with DRF-style pagination, plus configurable latency
+and error rate. Every request is counted by endpoint.
+"""
+import asyncio
+import random
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from aiohttp import web
+
+PAGE_SIZE = 100
+
+
+class FakeBackend:
+    def __init__(self, latency=0.005, jitter=0.0, error_rate=0.0, servers=3, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.users = {}
+        self.keys = {}
+        self.servers = [
+            {"id": i, "server_name": f"Server-{i}", "server_location": f"Location {i}", "active": True}
+            for i in range(1, servers + 1)
+        ]
+        self.base_url = None
+        self._runner = None
+
+    # Helpers
+
+    def _page(self, request, items):
+        page = int(request.query.get("page", 1))
+        start = (page - 1) * PAGE_SIZE
+        results = items[start:start + PAGE_SIZE]
+        next_url = None
+        if start + PAGE_SIZE < len(items):
+            next_url = f"{self.base_url}{request.rel_url.update_query(page=page + 1)}"
+        return web.json_response({"count": len(items), "next": next_url, "previous": None, "results": results})
+
+    @web.middleware
+    async def _chaos(self, request, handler):
+        endpoint = re.sub(r"/\d+(?=/|$)", "/{id}", request.path)
+        self.calls[f"{request.method} {endpoint}"] += 1
+
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.json_response({"detail": "injected failure"}, status=503)
+        return await handler(request)
+
+    # Routes
+
+    async def list_users(self, request):
+        users = list(self.users.values())
+        if "telegram_id" in request.query:
+            telegram_id = int(request.query["telegram_id"])
+            users = [user for user in users if user["telegram_id"] == telegram_id]
+        return self._page(request, users)
+
+    async def create_user(self, request):
+        data = await request.json()
+        user = dict(data, id=len(self.users) + 1)
+        self.users[user["id"]] = user
+        return web.json_response(user, status=201)
+
+    async def update_user(self, request):
+        user = self.users.get(int(request.match_info["id"]))
+        if user is None:
+            return web.json_response({"detail": "Not found."}, status=404)
+        user.update(await request.json())
+        return web.json_response(user)
+
+    async def user_keys(self, request):
+        user = self.users.get(int(request.match_info["id"]))
+        if user is None:
+            return web.json_response({"detail": "Not found."}, status=404)
+        return web.json_response([key for key in self.keys.values() if key["user_id"] == user["id"]])
+
+    async def list_servers(self, request):
+        return self._page(request, self.servers)
+
+    async def list_keys(self, request):
+        return self._page(request, list(self.keys.values()))
+
+    async def create_key(self, request):
+        data = await request.json()
+        user = self.users.get(data["user_id"])
+        server = next((s for s in self.servers if s["id"] == data["server_id"]), None)
+        if user is None or server is None:
+            return web.json_response({"detail": "Not found."}, status=404)
+
+        key_id = len(self.keys) + 1
+        key = {
+            "id": key_id,
+            "user_id": user["id"],
+            "user_telegram_id": user["telegram_id"],
+            "server_name": server["server_name"],
+            "server_location": server["server_location"],
+            "name": data["name"],
+            "access_url": f"ss://Y2hhY2hhMjAtaWV0Zi1wb2x5MTMwNTprZXk{key_id:08d}@198.51.100.{server['id']}:443/?outline=1",
+            "traffic_limit": data.get("traffic_limit", 0),
+            "traffic_used": 0,
+            "expiration_date": (datetime.utcnow() + timedelta(days=data.get("expiration_days", 30))).isoformat(),
+            "is_active": True,
+        }
+        self.keys[key_id] = key
+        return web.json_response(key, status=201)
+
+    async def revoke_key(self, request):
+        key = self.keys.get(int(request.match_info["id"]))
+        if key is None:
+            return web.json_response({"detail": "Not found."}, status=404)
+        key["is_active"] = False
+        return web.json_response({"status": "revoked"})
+
+    # Lifecycle
+
+    def create_app(self):
+        app = web.Application(middlewares=[self._chaos])
+        app.router.add_get("/users/", self.list_users)
+        app.router.add_post("/users/", self.create_user)
+        app.router.add_patch("/users/{id:\\d+}/", self.update_user)
+        app.router.add_get("/users/{id:\\d+}/keys/", self.user_keys)
+        app.router.add_get("/servers/", self.list_servers)
+        app.router.add_get("/keys/", self.list_keys)
+        app.router.add_post("/keys/create_key/", self.create_key)
+        app.router.add_post("/keys/{id:\\d+}/revoke/", self.revoke_key)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,131 @@
+"""In-process stand-in for Redis, speaking enough RESP for FSM storage.
+
+Supports the commands aiogram's RedisStorage2 and the redis client's
+handshake use: PING, HELLO (RESP2 only), CLIENT, SELECT, GET, SET (EX/PX),
+DEL, EXISTS, TTL, KEYS, FLUSHDB and QUIT. Keys expire lazily on access.
+"""
+import asyncio
+import fnmatch
+import time
+
+
+class FakeRedis:
+    def __init__(self):
+        # key -> (value bytes, expires at or None)
+        self.data = {}
+        self.commands = 0
+        self._server = None
+
+    # RESP encoding
+
+    @staticmethod
+    def _bulk(value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    @staticmethod
+    def _int(value):
+        return b":%d\r\n" % value
+
+    @staticmethod
+    def _error(message):
+        return f"-ERR {message}\r\n".encode()
+
+    OK = b"+OK\r\n"
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command
+            return line.strip().split()
+
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    # Storage
+
+    def _get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args):
+        self.commands += 1
+        name = args[0].upper().decode()
+        args = args[1:]
+
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "HELLO":
+            if args and args[0] != b"2":
+                return b"-NOPROTO unsupported protocol version\r\n"
+            return b"*0\r\n"
+        if name in ("CLIENT", "SELECT"):
+            return self.OK
+        if name == "GET":
+            return self._bulk(self._get(args[0]))
+        if name == "SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[2:]]
+            if b"EX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+            elif b"PX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            self.data[args[0]] = (args[1], expires_at)
+            return self.OK
+        if name == "DEL":
+            return self._int(sum(self.data.pop(key, None) is not None for key in args))
+        if name == "EXISTS":
+            return self._int(sum(self._get(key) is not None for key in args))
+        if name == "TTL":
+            if self._get(args[0]) is None:
+                return self._int(-2)
+            expires_at = self.data[args[0]][1]
+            return self._int(-1 if expires_at is None else round(expires_at - time.monotonic()))
+        if name == "KEYS":
+            pattern = args[0].decode()
+            keys = [key for key in list(self.data) if self._get(key) is not None
+                    and fnmatch.fnmatchcase(key.decode(), pattern)]
+            return b"*%d\r\n" % len(keys) + b"".join(self._bulk(key) for key in keys)
+        if name == "FLUSHDB":
+            self.data.clear()
+            return self.OK
+        return self._error(f"unknown command '{name}'")
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if not args:
+                    break
+                if args[0].upper() == b"QUIT":
+                    writer.write(self.OK)
+                    break
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Lifecycle
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening and return the bound port"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
@@ -0,0 +1,89 @@
+"""Measure FSM data kept per key-creation conversation, before and after
+storing only the selected server id.
+
+"before" replays what the handlers used to store: the whole available
+server list at "Получить VPN" and a copy of the selected server dict at
+server selection (via get_data, which deep-copies). "after" stores just
+{"server_id": id}. Reports Python heap bytes in MemoryStorage (tracemalloc)
+and the JSON bytes SQLite/Redis storages write per conversation.
+
+Run from the project root:
+
+    python -m benchmarks.fsm_memory [--conversations 10000] [--servers 5 20 50]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import tracemalloc
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+
+def make_servers(count):
+    return [
+        {
+            "id": i,
+            "server_name": f"Server-{i}",
+            "server_location": f"Location {i}",
+            "ip_address": f"198.51.100.{i % 250}",
+            "port": 443,
+            "active": True,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+async def converse_before(storage, user, catalogue):
+    # process_create_vpn
+    servers = [server for server in catalogue if server["active"]]
+    await storage.set_state(chat=user, user=user, state="VPNStates:selecting_server")
+    await storage.update_data(chat=user, user=user, data={"available_servers": servers})
+    # process_server_selection
+    data = await storage.get_data(chat=user, user=user)
+    selected = next(server for server in data["available_servers"] if server["server_name"] == "Server-1")
+    await storage.update_data(chat=user, user=user, data={"selected_server": selected})
+    await storage.set_state(chat=user, user=user, state="VPNStates:confirming_key")
+
+
+async def converse_after(storage, user, catalogue):
+    await storage.set_state(chat=user, user=user, state="VPNStates:selecting_server")
+    await storage.update_data(chat=user, user=user, data={"server_id": 1})
+    await storage.set_state(chat=user, user=user, state="VPNStates:confirming_key")
+
+
+async def measure(converse, conversations, catalogue):
+    """Return heap bytes per conversation in MemoryStorage and JSON bytes of its data"""
+    storage = MemoryStorage()
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    for user in range(1, conversations + 1):
+        await converse(storage, user, catalogue)
+
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    serialized = len(json.dumps(storage.data["1"]["1"]["data"]).encode())
+    return used / conversations, serialized
+
+
+async def run(args):
+    print(f"{'servers':>7} {'payload':>7} {'heap B/conv':>12} {'json B/conv':>12}")
+    for count in args.servers:
+        catalogue = make_servers(count)
+        for name, converse in (("before", converse_before), ("after", converse_after)):
+            heap, serialized = await measure(converse, args.conversations, catalogue)
+            print(f"{count:>7} {name:>7} {heap:>12.0f} {serialized:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=10000)
+    parser.add_argument("--servers", type=int, nargs="+", default=[5, 20, 50])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
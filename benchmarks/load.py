@@ -0,0 +1,187 @@
+"""End-to-end load benchmark: synthetic updates through the real dispatcher.
+
+Starts the fake backend (benchmarks/fake_backend.py), points API_URL at it,
+builds the dispatcher from main.py around a recording Bot that never talks
+to Telegram, and plays the main user flow for many synthetic users:
+/start, "Мои VPN ключи", "Получить VPN", server selection, "Подтвердить",
+"Мои VPN ключи".
+
+Run from the project root:
+
+    python -m benchmarks.load --users 500 --concurrency 50 --latency 0.01 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import statistics
+import time
+from collections import Counter, defaultdict
+from benchmarks.fake_backend import FakeBackend
+
+FLOW = ("/start", "Мои VPN ключи", "Получить VPN", "{server}", "Подтвердить", "Мои VPN ключи")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def make_recording_bot(throttled, telegram_latency):
+    """Build a Bot subclass whose API calls are recorded instead of sent"""
+    from aiogram import Bot
+    from main import scheduler
+    from utils.sender import ThrottledBot
+
+    message_ids = itertools.count(1)
+
+    class RecordingBot(Bot):
+        calls = Counter()
+
+        def _message(self, chat_id, **extra):
+            return dict(
+                message_id=next(message_ids), date=int(time.time()),
+                chat={"id": chat_id, "type": "private"}, **extra,
+            )
+
+        async def request(self, method, data=None, files=None, **kwargs):
+            self.calls[method] += 1
+            if telegram_latency:
+                await asyncio.sleep(telegram_latency)
+
+            data = data or {}
+            chat_id = int(data.get("chat_id", 0) or 0)
+            if method == "sendMessage":
+                return self._message(chat_id, text=data.get("text", ""))
+            if method == "sendPhoto":
+                return self._photo(chat_id)
+            if method == "sendMediaGroup":
+                return [self._photo(chat_id) for _ in json.loads(data["media"])]
+            if method == "sendDocument":
+                return self._message(chat_id, document={"file_id": "doc", "file_unique_id": "doc"})
+            if method == "editMessageText":
+                return self._message(chat_id, text=data.get("text", ""))
+            return True
+
+        def _photo(self, chat_id):
+            file_id = f"photo-{next(message_ids)}"
+            return self._message(chat_id, photo=[{
+                "file_id": file_id, "file_unique_id": file_id, "width": 410, "height": 410,
+            }])
+
+    class ThrottledRecordingBot(ThrottledBot, RecordingBot):
+        pass
+
+    token = "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA"
+    if throttled:
+        return ThrottledRecordingBot(token=token, scheduler=scheduler)
+    return RecordingBot(token=token)
+
+
+def make_update(update_id, user_id, text):
+    from aiogram import types
+
+    return types.Update(**{
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"},
+            "text": text,
+        },
+    })
+
+
+async def run(args):
+    backend = FakeBackend(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    os.environ["API_URL"] = await backend.start()
+
+    # Imported only now so config picks up the fake backend URL
+    from aiogram import Bot, Dispatcher
+    from main import create_dispatcher
+
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    from utils import api, vpn
+
+    bot = make_recording_bot(args.throttled, args.telegram_latency)
+    dp = create_dispatcher(bot)
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+
+    update_ids = itertools.count(1)
+    # FLOW position -> latencies, a step can appear twice
+    latencies = defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def play(user_index):
+        user_id = 10_000_000 + user_index
+        server = backend.servers[user_index % len(backend.servers)]["server_name"]
+        async with semaphore:
+            for _ in range(args.rounds):
+                for position, step in enumerate(FLOW):
+                    update = make_update(next(update_ids), user_id, step.format(server=server))
+                    started = time.perf_counter()
+                    # One task per update, as polling and the webhook do: aiogram
+                    # caches the FSM state in a context variable per task
+                    await asyncio.ensure_future(dp.process_update(update))
+                    latencies[position].append(time.perf_counter() - started)
+                    if args.think_time:
+                        await asyncio.sleep(args.think_time)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(play(i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    updates = len(all_latencies)
+    backend_calls = sum(backend.calls.values())
+
+    print(f"updates: {updates} in {elapsed:.2f}s -> {updates / elapsed:.1f} updates/s")
+    print(f"latency p50 {percentile(all_latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(all_latencies, 0.99) * 1000:.1f} ms")
+    print("\nper step (p50 / p99 ms):")
+    for position, step in enumerate(FLOW):
+        values = latencies[position]
+        print(f"  {step:<16} {percentile(values, 0.5) * 1000:8.1f} {percentile(values, 0.99) * 1000:8.1f}"
+              f"  mean {statistics.mean(values) * 1000:.1f}")
+    print(f"\nbackend calls: {backend_calls} ({backend_calls / updates:.2f} per update)")
+    for endpoint, count in backend.calls.most_common():
+        print(f"  {endpoint:<28} {count}")
+    print("\ntelegram calls:")
+    for method, count in type(bot).calls.most_common():
+        print(f"  {method:<28} {count}")
+    print(f"\nQR cache: {vpn.qr_png_cache.stats()}")
+    print(f"user id cache: {api.user_id_cache.stats()}")
+    print(f"user keys cache: {api.user_keys_cache.stats()}")
+
+    await dp.storage.close()
+    await dp.storage.wait_closed()
+    await api.server_catalogue.stop()
+    await api.close_session()
+    vpn.shutdown_qr_pool()
+    session = await bot.get_session()
+    await session.close()
+    await backend.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=1, help="times each user repeats the flow")
+    parser.add_argument("--latency", type=float, default=0.005, help="backend latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random backend latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of backend requests failing with 503")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="simulated Bot API latency, seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause between a user's taps, seconds")
+    parser.add_argument("--throttled", action="store_true", help="pace sends through the real SendScheduler")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compare QR encoders by PNG size and render time.
+
+Run from the project root:
+
+    python -m benchmarks.qr_encoder [--runs 200] [--box-size 10 6 4] [--levels L M]
+"""
+import argparse
+import statistics
+import time
+from utils.vpn import _render_qr_png_compact, ERROR_CORRECTION_LEVELS
+import qrcode
+import io
+
+SAMPLE_URLS = [
+    "ss://Y2hhY2hhMjAtaWV0Zi1wb2x5MTMwNTpwYXNzd29yZA@198.51.100.10:54321/?outline=1",
+    "ss://Y2hhY2hhMjAtaWV0Zi1wb2x5MTMwNTpBbm90aGVyTG9uZ2VyUGFzc3dvcmQxMjM0NTY3OA"
+    "@vpn-node-01.example.org:8443/?outline=1#MIREA%20VPN%20Moscow",
+]
+
+
+def render_default(access_url, box_size, level):
+    """Current path: qrcode.make_image via PIL"""
+    qr = qrcode.QRCode(version=1, error_correction=ERROR_CORRECTION_LEVELS[level], box_size=box_size, border=4)
+    qr.add_data(access_url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_compact(access_url, box_size, level):
+    return _render_qr_png_compact(access_url, box_size=box_size, border=4, error_correction=level)
+
+
+def measure(render, access_url, box_size, level, runs):
+    timings = []
+    png = b""
+    for _ in range(runs):
+        started = time.perf_counter()
+        png = render(access_url, box_size, level)
+        timings.append(time.perf_counter() - started)
+    return len(png), statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--box-size", type=int, nargs="+", default=[10, 6, 4])
+    parser.add_argument("--levels", nargs="+", default=["L", "M"])
+    args = parser.parse_args()
+
+    print(f"{'url':>4} {'lvl':>3} {'box':>3} {'encoder':>8} {'bytes':>7} {'ms':>7}")
+    for index, access_url in enumerate(SAMPLE_URLS):
+        for level in args.levels:
+            for box_size in args.box_size:
+                for name, render in (("default", render_default), ("compact", render_compact)):
+                    size, ms = measure(render, access_url, box_size, level, args.runs)
+                    print(f"{index:>4} {level:>3} {box_size:>3} {name:>8} {size:>7} {ms:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
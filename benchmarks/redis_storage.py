@@ -0,0 +1,103 @@
+"""Check and time FSM_STORAGE=redis against a Redis-protocol server.
+
+Starts the in-process stand-in (benchmarks/fake_redis.py) unless --port
+points at a real Redis, builds the storage exactly as the bot does
+(utils.storage.create_storage with FSM_STORAGE=redis), verifies state,
+data, bucket, reset and TTL behaviour, then times many key-creation
+conversations.
+
+Needs the redis package from requirements.txt. Run from the project root:
+
+    python -m benchmarks.redis_storage [--conversations 2000] [--host localhost --port 6379]
+"""
+import argparse
+import asyncio
+import os
+import time
+from benchmarks.fake_redis import FakeRedis
+
+
+async def check(storage, prefix):
+    chat = user = 42
+
+    assert await storage.get_state(chat=chat, user=user) is None
+    await storage.set_state(chat=chat, user=user, state="VPNStates:selecting_server")
+    assert await storage.get_state(chat=chat, user=user) == "VPNStates:selecting_server"
+
+    await storage.update_data(chat=chat, user=user, data={"server_id": 3})
+    await storage.update_data(chat=chat, user=user, note="тест")
+    assert await storage.get_data(chat=chat, user=user) == {"server_id": 3, "note": "тест"}
+
+    await storage.update_bucket(chat=chat, user=user, bucket={"hits": 1})
+    assert await storage.get_bucket(chat=chat, user=user) == {"hits": 1}
+
+    # Another chat of the same user is a separate conversation
+    assert await storage.get_state(chat=chat + 1, user=user) is None
+
+    await storage.reset_state(chat=chat, user=user)
+    assert await storage.get_state(chat=chat, user=user) is None
+    assert await storage.get_data(chat=chat, user=user) == {}
+
+    await storage.set_state(chat=chat, user=user, state="VPNStates:confirming_key")
+    redis = storage.storage._redis
+    ttl = await redis.ttl(f"{prefix}:{chat}:{user}:state")
+    assert ttl > 0, f"state key has no TTL ({ttl})"
+    await storage.finish(chat=chat, user=user)
+
+
+async def converse(storage, user):
+    # What a key-creation conversation does with the storage
+    await storage.set_state(chat=user, user=user, state="VPNStates:selecting_server")
+    await storage.update_data(chat=user, user=user, data={"server_id": 1})
+    await storage.set_state(chat=user, user=user, state="VPNStates:confirming_key")
+    await storage.get_data(chat=user, user=user)
+    await storage.finish(chat=user, user=user)
+
+
+async def run(args):
+    fake = None
+    port = args.port
+    if port is None:
+        fake = FakeRedis()
+        port = await fake.start()
+
+    os.environ.update(FSM_STORAGE="redis", REDIS_HOST=args.host, REDIS_PORT=str(port), FSM_STATE_TTL="600")
+    # Imported only now so config picks up the settings above
+    from config import REDIS_PREFIX
+    from utils.storage import create_storage
+
+    storage = create_storage()
+    try:
+        await check(storage, REDIS_PREFIX)
+        print(f"checks passed against {'stand-in' if fake else 'redis'} at {args.host}:{port}")
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def play(user):
+            async with semaphore:
+                await converse(storage, user)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(play(30_000_000 + i) for i in range(args.conversations)))
+        elapsed = time.perf_counter() - started
+        print(f"{args.conversations} conversations in {elapsed:.2f}s -> {args.conversations / elapsed:.0f}/s")
+        if fake is not None:
+            print(f"commands: {fake.commands}, keys left: {len(fake.data)}")
+    finally:
+        await storage.close()
+        await storage.wait_closed()
+        if fake is not None:
+            await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="real Redis port (default: start the stand-in)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
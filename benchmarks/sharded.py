@@ -0,0 +1,120 @@
+"""Throughput of sharded mode: the user flow from benchmarks/load.py routed
+by chat id to N worker processes.
+
+The parent process runs the fake backend and plays the front: it routes
+every user's flow through ShardRouter as fast as the worker queues accept
+it. Each worker runs the real dispatcher around a recording Bot inside
+ShardWorker. A key is created only if a user's "Получить VPN", server and
+"Подтвердить" updates were processed in order, so the number of keys the
+backend created checks per-chat ordering as well.
+
+Run from the project root:
+
+    python -m benchmarks.sharded --users 500 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from benchmarks.fake_backend import FakeBackend
+from benchmarks.load import FLOW, make_recording_bot, make_update
+
+
+def worker(index, source, shards, api_url, telegram_latency, max_in_flight, ready, results):
+    os.environ["API_URL"] = api_url
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Imported only now so config picks up the fake backend URL
+    from main import create_dispatcher
+    from utils import api, vpn
+    from utils.shards import ShardWorker
+
+    async def serve():
+        bot = make_recording_bot(False, telegram_latency)
+        dp = create_dispatcher(bot)
+        ready.put(index)
+
+        shard = ShardWorker(dp, source, max_in_flight=max_in_flight)
+        await shard.run()
+        results.put(shard.processed)
+
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        await api.server_catalogue.stop()
+        await api.close_session()
+        session = await bot.get_session()
+        await session.close()
+        vpn.shutdown_qr_pool()
+
+    asyncio.run(serve())
+
+
+async def measure(args, backend, api_url, shards):
+    from utils.shards import ShardRouter, start_workers
+
+    context = multiprocessing.get_context("spawn")
+    ready, results = context.Queue(), context.Queue()
+    processes, queues = start_workers(
+        worker, shards, api_url, args.telegram_latency, args.max_in_flight, ready, results,
+        queue_size=args.queue_size,
+    )
+    loop = asyncio.get_running_loop()
+    for _ in range(shards):
+        await loop.run_in_executor(None, ready.get)
+
+    router = ShardRouter(queues)
+    servers = [server["server_name"] for server in backend.servers]
+    update_id = 0
+    created_before = backend.calls["POST /keys/create_key/"]
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for step in FLOW:
+            for user_index in range(args.users):
+                update_id += 1
+                text = step.format(server=servers[user_index % len(servers)])
+                await router.route(make_update(update_id, 20_000_000 + user_index, text).to_python())
+    await loop.run_in_executor(None, router.stop)
+
+    processed = 0
+    for _ in range(shards):
+        processed += await loop.run_in_executor(None, results.get)
+    elapsed = time.perf_counter() - started
+
+    for process in processes:
+        await loop.run_in_executor(None, process.join)
+
+    return processed, elapsed, backend.calls["POST /keys/create_key/"] - created_before, router.routed
+
+
+async def run(args):
+    backend = FakeBackend(latency=args.latency)
+    api_url = await backend.start()
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    print(f"cpus: {os.cpu_count()}, updates per run: {args.users * args.rounds * len(FLOW)}\n")
+    print(f"{'workers':>7} {'updates/s':>10} {'seconds':>8} {'keys':>9}  per shard")
+    for shards in args.workers:
+        processed, elapsed, keys, routed = await measure(args, backend, api_url, shards)
+        print(f"{shards:>7} {processed / elapsed:>10.1f} {elapsed:>8.2f} "
+              f"{keys:>4}/{args.users * args.rounds:<4}  {routed}")
+
+    await backend.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=1, help="times each user repeats the flow")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--latency", type=float, default=0.005, help="backend latency, seconds")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="simulated Bot API latency, seconds")
+    parser.add_argument("--max-in-flight", type=int, default=100, help="updates processed at once per worker")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,121 @@ from decouple import config
 BOT_TOKEN = ''
 ADMIN_IDS = []# list(map(int, config('ADMIN_IDS', default='').split(',')))
 
+# Run mode: 'polling', 'webhook' or 'sharded'
+RUN_MODE = config('RUN_MODE', default='polling')
+WEBHOOK_HOST = config('WEBHOOK_HOST', default='')
+WEBHOOK_PATH = config('WEBHOOK_PATH', default='/webhook')
+WEBHOOK_SECRET = config('WEBHOOK_SECRET', default='')
+WEBAPP_HOST = config('WEBAPP_HOST', default='0.0.0.0')
+WEBAPP_PORT = int(config('WEBAPP_PORT', default='8080'))
+WEBHOOK_MAX_IN_FLIGHT = int(config('WEBHOOK_MAX_IN_FLIGHT', default='100'))
+
+# Sharded mode: a front process receives updates ('polling' or 'webhook') and routes
+# them by chat id to worker processes (0 = one per CPU); each worker processes up to
+# WEBHOOK_MAX_IN_FLIGHT updates at once
+SHARD_SOURCE = config('SHARD_SOURCE', default='polling')
+SHARD_WORKERS = int(config('SHARD_WORKERS', default='0'))
+SHARD_QUEUE_SIZE = int(config('SHARD_QUEUE_SIZE', default='1000'))
+
+# Outgoing message rate limits (Telegram allows ~30 msg/s overall, ~1 msg/s per chat)
+SEND_GLOBAL_RATE = float(config('SEND_GLOBAL_RATE', default='30'))
+SEND_CHAT_RATE = float(config('SEND_CHAT_RATE', default='1'))
+SEND_CHAT_BURST = int(config('SEND_CHAT_BURST', default='3'))
+SEND_MAX_RETRIES = int(config('SEND_MAX_RETRIES', default='3'))
+
+# Admin broadcast
+BROADCAST_CHECKPOINT_PATH = config('BROADCAST_CHECKPOINT_PATH', default='broadcast.json')
+BROADCAST_CONCURRENCY = int(config('BROADCAST_CONCURRENCY', default='20'))
+BROADCAST_PROGRESS_INTERVAL = float(config('BROADCAST_PROGRESS_INTERVAL', default='5'))
+
+# Admin exports are written to a temp file while pages stream in
+EXPORT_PROGRESS_INTERVAL = float(config('EXPORT_PROGRESS_INTERVAL', default='3'))
+
+# Admin bulk key revocation
+BULK_REVOKE_CONCURRENCY = int(config('BULK_REVOKE_CONCURRENCY', default='5'))
+BULK_REVOKE_RETRIES = int(config('BULK_REVOKE_RETRIES', default='3'))
+# How long a bulk revocation waits for the backend circuit breaker before giving up
+BULK_REVOKE_MAX_PAUSE = float(config('BULK_REVOKE_MAX_PAUSE', default='300'))
+BULK_REVOKE_PROGRESS_INTERVAL = float(config('BULK_REVOKE_PROGRESS_INTERVAL', default='3'))
+
+# Key sync: traffic and expiry alerts (KEY_SYNC_INTERVAL=0 disables)
+KEY_SYNC_INTERVAL = float(config('KEY_SYNC_INTERVAL', default='300'))
+# Set when the backend supports /keys/?updated_since=<updated_at>
+KEY_SYNC_CURSOR = config('KEY_SYNC_CURSOR', default=False, cast=bool)
+KEY_SYNC_STATE_PATH = config('KEY_SYNC_STATE_PATH', default='key_sync.json')
+KEY_ALERT_TRAFFIC_THRESHOLDS = config('KEY_ALERT_TRAFFIC_THRESHOLDS', default='0.8,1.0')
+KEY_ALERT_EXPIRY_DAYS = float(config('KEY_ALERT_EXPIRY_DAYS', default='3'))
+
 # Backend API settings
 API_URL = config('API_URL', default='https://volkov-egor.tech/api')
 API_USERNAME = config('API_USERNAME', default='admin')
 API_PASSWORD = config('API_PASSWORD', default='admin')
 
+# Backend HTTP client settings
+API_TIMEOUT = float(config('API_TIMEOUT', default='10'))
+API_CONNECT_TIMEOUT = float(config('API_CONNECT_TIMEOUT', default='5'))
+API_KEEPALIVE_TIMEOUT = float(config('API_KEEPALIVE_TIMEOUT', default='30'))
+API_MAX_CONNECTIONS = int(config('API_MAX_CONNECTIONS', default='100'))
+API_MAX_CONCURRENCY = int(config('API_MAX_CONCURRENCY', default='50'))
+# Per-endpoint deadlines overriding API_TIMEOUT, e.g. "/servers/=3,/keys/create_key/=30"
+API_ENDPOINT_TIMEOUTS = config('API_ENDPOINT_TIMEOUTS', default='')
+API_MAX_RETRIES = int(config('API_MAX_RETRIES', default='2'))
+API_RETRY_BACKOFF = float(config('API_RETRY_BACKOFF', default='0.2'))
+API_RETRY_BACKOFF_MAX = float(config('API_RETRY_BACKOFF_MAX', default='2'))
+API_RETRY_BUDGET_RATIO = float(config('API_RETRY_BUDGET_RATIO', default='0.2'))
+BREAKER_FAILURE_THRESHOLD = int(config('BREAKER_FAILURE_THRESHOLD', default='5'))
+BREAKER_RECOVERY_TIMEOUT = float(config('BREAKER_RECOVERY_TIMEOUT', default='30'))
+# How long last known keys are served while the backend is down
+KEYS_FALLBACK_TTL = float(config('KEYS_FALLBACK_TTL', default='86400'))
+
+# telegram_id -> backend user id cache
+USER_CACHE_SIZE = int(config('USER_CACHE_SIZE', default='10000'))
+USER_CACHE_TTL = float(config('USER_CACHE_TTL', default='3600'))
+
+# Per-user keys cache warmed on /start and /vpn (0 disables prefetch)
+KEYS_CACHE_TTL = float(config('KEYS_CACHE_TTL', default='30'))
+
+# Server catalogue: served from memory, refreshed in the background
+SERVER_CATALOGUE_TTL = float(config('SERVER_CATALOGUE_TTL', default='300'))
+SERVER_CATALOGUE_REFRESH_INTERVAL = float(config('SERVER_CATALOGUE_REFRESH_INTERVAL', default='60'))
+
+# Local SQLite copy of users/keys/servers for admin queries (interval 0 disables)
+REPLICA_PATH = config('REPLICA_PATH', default='replica.sqlite3')
+REPLICA_SYNC_INTERVAL = float(config('REPLICA_SYNC_INTERVAL', default='600'))
+
 # Default VPN settings
 DEFAULT_TRAFFIC_LIMIT_GB = float(config('DEFAULT_TRAFFIC_LIMIT_GB', default='10'))
 DEFAULT_EXPIRATION_DAYS = int(config('DEFAULT_EXPIRATION_DAYS', default='30'))
 
+# QR code caches
+QR_CACHE_MAX_BYTES = int(config('QR_CACHE_MAX_BYTES', default=str(32 * 1024 * 1024)))
+QR_FILE_ID_CACHE_SIZE = int(config('QR_FILE_ID_CACHE_SIZE', default='100000'))
+
+# QR rendering pool: 'thread' or 'process'
+QR_POOL = config('QR_POOL', default='thread')
+QR_WORKERS = int(config('QR_WORKERS', default='2'))
+QR_MAX_PENDING = int(config('QR_MAX_PENDING', default='64'))
+
+# QR encoder: 'default' (RGB PNG via PIL) or 'compact' (1-bit PNG)
+QR_ENCODER = config('QR_ENCODER', default='default')
+QR_BOX_SIZE = int(config('QR_BOX_SIZE', default='10'))
+QR_BORDER = int(config('QR_BORDER', default='4'))
+QR_ERROR_CORRECTION = config('QR_ERROR_CORRECTION', default='L')
+
+# FSM storage: 'memory', 'sqlite' or 'redis' (redis package, benchmarks/redis_storage.py checks it)
+FSM_STORAGE = config('FSM_STORAGE', default='memory')
+FSM_SQLITE_PATH = config('FSM_SQLITE_PATH', default='fsm.sqlite3')
+FSM_STATE_TTL = int(config('FSM_STATE_TTL', default='86400'))
+FSM_FLUSH_INTERVAL = float(config('FSM_FLUSH_INTERVAL', default='1'))
+REDIS_HOST = config('REDIS_HOST', default='localhost')
+REDIS_PORT = int(config('REDIS_PORT', default='6379'))
+REDIS_DB = int(config('REDIS_DB', default='0'))
+REDIS_PASSWORD = config('REDIS_PASSWORD', default='')
+REDIS_PREFIX = config('REDIS_PREFIX', default='vpn_bot_fsm')
+REDIS_POOL_SIZE = int(config('REDIS_POOL_SIZE', default='20'))
+
+# Prometheus /metrics port in polling mode (0 disables; webhook mode serves it on WEBAPP_PORT)
+METRICS_PORT = int(config('METRICS_PORT', default='0'))
+
 # Other settings
 LOG_LEVEL = config('LOG_LEVEL', default='INFO')
\ No newline at end of file
@@ -1,8 +1,14 @@
 from aiogram import Dispatcher
 from handlers import common, user, admin
+from utils.router import ButtonRouter
 
 def register_all_handlers(dp: Dispatcher):
     """Register all handlers for the bot"""
+    router = ButtonRouter()
+
     common.register_handlers(dp)
-    user.register_handlers(dp)
-    admin.register_handlers(dp)
\ No newline at end of file
+    user.register_handlers(dp, router)
+    admin.register_handlers(dp, router)
+
+    # All menu buttons are matched by one dict lookup
+    router.register(dp)
\ No newline at end of file
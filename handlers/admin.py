@@ -1,11 +1,36 @@
+import asyncio
+import io
 import logging
+import os
+import time
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.dispatcher.filters import IDFilter
 from keyboards.admin_kb import get_admin_menu
-from utils.api import get_all_users, get_all_servers, get_all_keys, revoke_key
-from config import ADMIN_IDS
+from keyboards.buttons import (
+    BTN_ADMIN_USERS, BTN_ADMIN_SERVERS, BTN_ADMIN_KEYS, BTN_ADMIN_REVOKE_KEY, BTN_CONFIRM, BTN_CANCEL,
+)
+from keyboards.user_kb import get_confirm_keyboard
+from utils.api import (
+    get_all_servers, iter_users, iter_keys, revoke_key, server_catalogue,
+    get_backend_status, get_cache_stats, get_coalesce_stats,
+)
+from utils.broadcast import Broadcast
+from utils.bulk_revoke import SCOPES, BulkRevoke, select_keys
+from utils.export import DATASETS, FORMATS, MAX_DOCUMENT_BYTES, export_dataset, export_filename
+from utils.replica import replica
+from utils.metrics import (
+    handler_seconds, handler_errors, backend_seconds, qr_render_seconds, fsm_storage_ops, loop_lag_seconds,
+)
+from utils.router import ButtonRouter
+from utils.sender import bulk_sending
+from utils.telegram import MESSAGE_LIMIT, answer_chunked, progress_editor
+from config import (
+    ADMIN_IDS, BROADCAST_CHECKPOINT_PATH, BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_INTERVAL,
+    EXPORT_PROGRESS_INTERVAL,
+    BULK_REVOKE_CONCURRENCY, BULK_REVOKE_RETRIES, BULK_REVOKE_MAX_PAUSE, BULK_REVOKE_PROGRESS_INTERVAL,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +39,16 @@ logger = logging.getLogger(__name__)
 class AdminStates(StatesGroup):
     waiting_for_user_id = State()
     waiting_for_key_id = State()
+    waiting_for_broadcast_text = State()
+    confirming_broadcast = State()
+    confirming_bulk_revoke = State()
+
+
+# Only one broadcast runs at a time
+_broadcast_task = None
+
+# admin id -> keys selected by /revoke_bulk, waiting for confirmation
+_bulk_revoke_plans = {}
 
 
 async def cmd_admin(message: types.Message):
@@ -27,29 +62,54 @@ async def cmd_admin(message: types.Message):
     )
 
 
+def _format_user(user):
+    return (
+        f"ID: {user['id']}\n"
+        f"Telegram ID: {user['telegram_id']}\n"
+        f"Username: {user.get('username', 'Не указан')}\n"
+        f"Имя: {user.get('first_name', 'Не указано')}\n"
+        f"Активен: {'Да' if user['is_active'] else 'Нет'}\n\n"
+    )
+
+
+def _format_server(server):
+    return (
+        f"ID: {server['id']}\n"
+        f"Имя: {server['server_name']}\n"
+        f"Локация: {server['server_location']}\n"
+        f"Активен: {'Да' if server['active'] else 'Нет'}\n\n"
+    )
+
+
+def _format_key(key):
+    return (
+        f"ID: {key['id']}\n"
+        f"Пользователь: {key['user_telegram_id']}\n"
+        f"Сервер: {key['server_name']}\n"
+        f"Название: {key['name']}\n"
+        f"Активен: {'Да' if key['is_active'] else 'Нет'}\n\n"
+    )
+
+
 async def admin_show_users(message: types.Message):
     """Show all users to admin"""
     if message.from_user.id not in ADMIN_IDS:
         return
 
-    users = await get_all_users()
-
-    if not users:
-        await message.answer("Пользователей не найдено")
+    try:
+        with bulk_sending():
+            count = await answer_chunked(
+                message,
+                "👥 Список пользователей:\n\n",
+                (_format_user(user) async for user in iter_users())
+            )
+    except Exception as e:
+        logger.error(f"Error listing users: {e}")
+        await message.answer(f"❌ Ошибка при загрузке пользователей: {str(e)}")
         return
 
-    text = "👥 Список пользователей:\n\n"
-
-    for user in users:
-        text += (
-            f"ID: {user['id']}\n"
-            f"Telegram ID: {user['telegram_id']}\n"
-            f"Username: {user.get('username', 'Не указан')}\n"
-            f"Имя: {user.get('first_name', 'Не указано')}\n"
-            f"Активен: {'Да' if user['is_active'] else 'Нет'}\n\n"
-        )
-
-    await message.answer(text)
+    if not count:
+        await message.answer("Пользователей не найдено")
 
 
 async def admin_show_servers(message: types.Message):
@@ -63,44 +123,253 @@ async def admin_show_servers(message: types.Message):
         await message.answer("Серверы не найдены")
         return
 
-    text = "🖥️ Список серверов:\n\n"
+    await answer_chunked(message, "🖥️ Список серверов:\n\n", map(_format_server, servers))
+
+
+async def admin_refresh_servers(message: types.Message):
+    """Force a reload of the cached server list"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    try:
+        servers = await server_catalogue.refresh()
+    except Exception as e:
+        logger.error(f"Error refreshing servers: {e}")
+        await message.answer(f"❌ Не удалось обновить список серверов: {str(e)}")
+        return
+
+    await message.answer(f"✅ Список серверов обновлен. Серверов: {len(servers)}")
 
-    for server in servers:
-        text += (
-            f"ID: {server['id']}\n"
-            f"Имя: {server['server_name']}\n"
-            f"Локация: {server['server_location']}\n"
-            f"Активен: {'Да' if server['active'] else 'Нет'}\n\n"
-        )
+
+async def admin_backend_status(message: types.Message):
+    """Show circuit breaker, retry budget and cache state"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    status = get_backend_status()
+    breaker = status['breaker']
+    budget = status['retry_budget']
+    user_cache = get_cache_stats()['user_id']
+
+    text = (
+        f"🩺 Состояние бэкенда\n\n"
+        f"Circuit breaker: {breaker['state']}\n"
+        f"Ошибок подряд: {breaker['failures']}\n"
+        f"Отклонено запросов: {breaker['rejected']}\n"
+        f"Открыт, сек: {breaker['open_for']}\n\n"
+        f"Бюджет ретраев: {budget['tokens']} (исчерпан {budget['exhausted']} раз)\n"
+        f"Кэш пользователей: {user_cache['size']} записей, hit rate {user_cache['hit_rate']:.0%}\n"
+        f"Серверы: версия {server_catalogue.version}, "
+        f"{'устарели' if server_catalogue.is_stale else 'актуальны'}\n\n"
+        f"Объединено GET-запросов:\n"
+    )
+    for endpoint, stats in sorted(get_coalesce_stats().items()):
+        text += f"{endpoint}: {stats['coalesced']} из {stats['requests']}\n"
 
     await message.answer(text)
 
 
+def _format_latency(summary):
+    return f"{summary['count']} шт., avg {summary['avg'] * 1000:.0f} мс, p50 ≤{summary['p50']} с, p99 ≤{summary['p99']} с"
+
+
+def _stats_blocks():
+    yield "📈 Статистика\n\n⚙️ Обработчики:\n"
+    for labels, summary in handler_seconds.summaries():
+        yield f"{labels['handler']}: {_format_latency(summary)}\n"
+
+    errors = sorted(handler_errors.values.items())
+    if errors:
+        yield "\n❗ Ошибки:\n"
+        for key, count in errors:
+            labels = dict(key)
+            yield f"{labels['handler']} / {labels['exception']}: {count}\n"
+
+    yield "\n🌐 Бэкенд:\n"
+    for labels, summary in backend_seconds.summaries():
+        yield f"{labels['method']} {labels['endpoint']} [{labels['status']}]: {_format_latency(summary)}\n"
+
+    for labels, summary in qr_render_seconds.summaries():
+        yield f"\n🔳 QR ({labels['encoder']}): {_format_latency(summary)}\n"
+
+    for labels, summary in loop_lag_seconds.summaries():
+        yield f"\n⏱ Задержка event loop: p50 ≤{summary['p50']} с, p99 ≤{summary['p99']} с\n"
+
+    ops = ", ".join(f"{dict(key)['op']}={count}" for key, count in sorted(fsm_storage_ops.values.items()))
+    yield f"\n💾 FSM: {ops or 'нет операций'}\n"
+
+
+async def admin_stats(message: types.Message):
+    """Show handler, backend, QR and event loop metrics"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    await answer_chunked(message, "", _stats_blocks())
+
+
 async def admin_show_keys(message: types.Message):
     """Show all keys to admin"""
     if message.from_user.id not in ADMIN_IDS:
         return
 
-    keys = await get_all_keys()
+    try:
+        with bulk_sending():
+            count = await answer_chunked(
+                message,
+                "🔑 Список ключей:\n\n",
+                (_format_key(key) async for key in iter_keys())
+            )
+    except Exception as e:
+        logger.error(f"Error listing keys: {e}")
+        await message.answer(f"❌ Ошибка при загрузке ключей: {str(e)}")
+        return
 
-    if not keys:
+    if not count:
         await message.answer("Ключи не найдены")
+
+
+def _replica_age():
+    minutes = (time.time() - replica.updated_at) / 60
+    return f"данные реплики на {minutes:.0f} мин. назад"
+
+
+async def _replica_not_ready(message: types.Message):
+    if replica.ready:
+        return False
+    await message.answer("⏳ Локальная реплика еще не загружена, попробуйте позже или выполните /sync_replica")
+    return True
+
+
+async def admin_find_user(message: types.Message):
+    """Find users by Telegram id or username in the replica and show their keys"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    query = message.get_args()
+    if not query:
+        await message.answer("Использование: /find <telegram_id | @username>")
+        return
+    if await _replica_not_ready(message):
         return
 
-    text = "🔑 Список ключей:\n\n"
+    started = time.perf_counter()
+    users = replica.find_users(query)
+    blocks = []
+    for user in users:
+        blocks.append(_format_user(user))
+        blocks.extend(f"🔑 {_format_key(key)}" for key in replica.user_keys(user['telegram_id']))
+    elapsed = (time.perf_counter() - started) * 1000
 
-    for key in keys:
-        text += (
-            f"ID: {key['id']}\n"
-            f"Пользователь: {key['user_telegram_id']}\n"
-            f"Сервер: {key['server_name']}\n"
-            f"Название: {key['name']}\n"
-            f"Активен: {'Да' if key['is_active'] else 'Нет'}\n\n"
+    if not users:
+        await message.answer(f"Пользователи не найдены ({_replica_age()})")
+        return
+
+    await answer_chunked(
+        message, f"🔍 Найдено: {len(users)} за {elapsed:.1f} мс ({_replica_age()})\n\n", blocks
+    )
+
+
+async def admin_server_keys(message: types.Message):
+    """List keys of one server from the replica"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    server_name = message.get_args()
+    if not server_name:
+        await message.answer("Использование: /server_keys <имя сервера>")
+        return
+    if await _replica_not_ready(message):
+        return
+
+    keys = replica.server_keys(server_name)
+    if not keys:
+        await message.answer(f"На сервере {server_name} ключей нет ({_replica_age()})")
+        return
+
+    with bulk_sending():
+        await answer_chunked(
+            message,
+            f"🖥️ Ключи сервера {server_name}: {len(keys)} ({_replica_age()})\n\n",
+            (_format_key(key) for key in keys)
         )
 
+
+async def admin_active_keys(message: types.Message):
+    """Count active keys per server from the replica"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    if await _replica_not_ready(message):
+        return
+
+    started = time.perf_counter()
+    counts = replica.key_counts()
+    active = replica.active_key_count()
+    elapsed = (time.perf_counter() - started) * 1000
+
+    text = f"🔑 Активных ключей: {active} из {sum(total for _, _, total in counts)}\n\n"
+    text += "".join(f"{server_name}: {server_active} из {total}\n" for server_name, server_active, total in counts)
+    text += f"\n{elapsed:.1f} мс, {_replica_age()}"
     await message.answer(text)
 
 
+async def admin_sync_replica(message: types.Message):
+    """Reload the replica from the backend now"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    await message.answer("⏳ Обновляем реплику...")
+    try:
+        counts = await replica.sync()
+    except Exception as e:
+        logger.error(f"Error syncing replica: {e}")
+        await message.answer(f"❌ Не удалось обновить реплику: {str(e)}")
+        return
+
+    await message.answer(
+        f"✅ Реплика обновлена: пользователей {counts['users']}, ключей {counts['keys']}, серверов {counts['servers']}"
+    )
+
+
+async def admin_export(message: types.Message):
+    """Export users or keys as a CSV/JSONL document: /export users|keys [csv|jsonl] [gz]"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    args = message.get_args().lower().split()
+    dataset = args[0] if args else None
+    fmt = next((arg for arg in args[1:] if arg in FORMATS), "csv")
+    compress = "gz" in args[1:] or "gzip" in args[1:]
+
+    if dataset not in DATASETS:
+        await message.answer(f"Использование: /export {'|'.join(DATASETS)} [{'|'.join(FORMATS)}] [gz]")
+        return
+
+    progress = await message.answer(f"⏳ Экспорт {dataset}: 0 строк")
+    on_progress = progress_editor(progress, lambda rows: f"⏳ Экспорт {dataset}: {rows} строк", EXPORT_PROGRESS_INTERVAL)
+
+    try:
+        file, rows, size = await export_dataset(dataset, fmt, compress, on_progress=on_progress)
+    except Exception as e:
+        logger.error(f"Error exporting {dataset}: {e}")
+        await progress.edit_text(f"❌ Ошибка экспорта {dataset}: {str(e)}")
+        return
+
+    with file:
+        if size > MAX_DOCUMENT_BYTES:
+            await progress.edit_text(
+                f"❌ Файл слишком большой для Telegram: {size / 1024 ** 2:.1f} МБ. Попробуйте с параметром gz"
+            )
+            return
+
+        await progress.edit_text(f"📤 Экспорт {dataset}: {rows} строк, {size / 1024:.0f} КБ, отправляем...")
+        await message.answer_document(
+            types.InputFile(file, filename=export_filename(dataset, fmt, compress)),
+            caption=f"{dataset}: {rows} строк",
+        )
+
+    await progress.edit_text(f"✅ Экспорт {dataset} завершен: {rows} строк")
+
+
 async def admin_revoke_key_start(message: types.Message, state: FSMContext):
     """Start revoking a key as admin"""
     if message.from_user.id not in ADMIN_IDS:
@@ -133,18 +402,264 @@ async def admin_revoke_key_process(message: types.Message, state: FSMContext):
         await cmd_admin(message)
 
 
-def register_handlers(dp: Dispatcher):
+BULK_REVOKE_USAGE = (
+    "Использование:\n"
+    "/revoke_bulk user <telegram_id>\n"
+    "/revoke_bulk server <имя сервера>\n"
+    "/revoke_bulk expired\n"
+    "/revoke_bulk over_quota"
+)
+
+
+def _format_bulk_revoke_progress(bulk: BulkRevoke):
+    counts = bulk.counts
+    text = (
+        f"🗑 Отзыв ключей: {bulk.processed} из {len(bulk.keys)}\n"
+        f"✅ Отозвано: {counts['revoked']}\n"
+        f"🚫 Отклонено бэкендом: {counts['refused']}\n"
+        f"❌ Ошибок: {counts['failed']}"
+    )
+    if bulk.stopped:
+        text += f"\n⛔ Бэкенд недоступен, остановлено. Пропущено: {counts['skipped']}"
+    elif bulk.paused:
+        text += "\n⏸ Бэкенд недоступен, ждем восстановления"
+    return text
+
+
+async def admin_bulk_revoke_start(message: types.Message, state: FSMContext):
+    """Dry run of a bulk revocation: count matching keys and ask for confirmation"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    scope, _, arg = message.get_args().partition(" ")
+    arg = arg.strip()
+    if scope not in SCOPES or (scope == "user" and not arg.isdigit()) or (scope == "server" and not arg):
+        await message.answer(BULK_REVOKE_USAGE)
+        return
+
+    await message.answer("⏳ Ищем ключи...")
+    try:
+        keys = await select_keys(scope, arg)
+    except Exception as e:
+        logger.error(f"Error selecting keys to revoke: {e}")
+        await message.answer(f"❌ Ошибка при загрузке ключей: {str(e)}")
+        return
+
+    if not keys:
+        await message.answer("Активных ключей для отзыва не найдено")
+        return
+
+    per_server = {}
+    for key in keys:
+        per_server[key.get("server_name")] = per_server.get(key.get("server_name"), 0) + 1
+
+    text = f"🗑 Будет отозвано активных ключей: {len(keys)}\n\n"
+    text += "".join(f"{server_name}: {count}\n" for server_name, count in sorted(per_server.items()))
+    text += "\nПодтвердите отзыв"
+
+    _bulk_revoke_plans[message.from_user.id] = keys
+    await message.answer(text, reply_markup=get_confirm_keyboard())
+    await AdminStates.confirming_bulk_revoke.set()
+
+
+async def admin_bulk_revoke_process(message: types.Message, state: FSMContext):
+    """Revoke the keys selected by the dry run, then send the per-key report"""
+    await state.finish()
+    keys = _bulk_revoke_plans.pop(message.from_user.id, None)
+
+    if message.text != BTN_CONFIRM:
+        await message.answer("Отзыв ключей отменен")
+        await cmd_admin(message)
+        return
+    if keys is None:
+        await message.answer("Список ключей устарел, выполните /revoke_bulk еще раз")
+        await cmd_admin(message)
+        return
+
+    bulk = BulkRevoke(
+        keys, concurrency=BULK_REVOKE_CONCURRENCY, retries=BULK_REVOKE_RETRIES, max_pause=BULK_REVOKE_MAX_PAUSE
+    )
+    progress = await message.answer(_format_bulk_revoke_progress(bulk))
+    on_progress = progress_editor(progress, _format_bulk_revoke_progress, BULK_REVOKE_PROGRESS_INTERVAL)
+
+    try:
+        await bulk.run(on_progress)
+    except Exception as e:
+        logger.error(f"Bulk revoke interrupted: {e}")
+        await message.answer(f"❌ Отзыв ключей прерван: {str(e)}")
+
+    await on_progress(bulk, force=True)
+
+    await message.answer_document(
+        types.InputFile(io.BytesIO(bulk.report()), filename=f"revoke_{time.strftime('%Y%m%d_%H%M%S')}.csv"),
+        caption="🏁 Отзыв завершен\n\n" + _format_bulk_revoke_progress(bulk),
+    )
+    await cmd_admin(message)
+
+
+def _format_broadcast_progress(broadcast: Broadcast):
+    state = broadcast.state
+    return (
+        f"📣 Рассылка: обработано {broadcast.processed}\n"
+        f"✅ Доставлено: {state['delivered']}\n"
+        f"🚫 Пропущено: {state['skipped']}\n"
+        f"❌ Ошибок: {state['failed']}"
+    )
+
+
+async def _run_broadcast(progress: types.Message, broadcast: Broadcast):
+    """Run a broadcast in the background, editing the progress message as it goes"""
+    on_progress = progress_editor(progress, _format_broadcast_progress, BROADCAST_PROGRESS_INTERVAL)
+
+    try:
+        await broadcast.run(on_progress)
+    except Exception as e:
+        logger.error(f"Broadcast interrupted: {e}")
+        await progress.answer(f"❌ Рассылка прервана: {str(e)}\nПродолжить: /broadcast_resume")
+        return
+
+    await progress.answer("🏁 Рассылка завершена\n\n" + _format_broadcast_progress(broadcast))
+
+
+def _broadcast_running():
+    return _broadcast_task is not None and not _broadcast_task.done()
+
+
+async def _start_broadcast(message: types.Message, broadcast: Broadcast):
+    global _broadcast_task
+
+    progress = await message.answer(_format_broadcast_progress(broadcast))
+    _broadcast_task = asyncio.ensure_future(_run_broadcast(progress, broadcast))
+
+
+async def _broadcast_blocked(message: types.Message):
+    """Tell the admin why a new broadcast can't start now, if so"""
+    if _broadcast_running():
+        await message.answer("⏳ Рассылка уже идет")
+        return True
+    if os.path.exists(BROADCAST_CHECKPOINT_PATH):
+        await message.answer(
+            "⚠️ Есть незавершенная рассылка.\n"
+            "Продолжить: /broadcast_resume\n"
+            "Удалить ее и начать новую: /broadcast_discard"
+        )
+        return True
+    return False
+
+
+async def admin_broadcast_start(message: types.Message, state: FSMContext):
+    """Ask admin for the broadcast text"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    if await _broadcast_blocked(message):
+        return
+
+    await message.answer("Введите текст рассылки:")
+    await AdminStates.waiting_for_broadcast_text.set()
+
+
+async def admin_broadcast_process(message: types.Message, state: FSMContext):
+    """Show the entered broadcast text and ask for confirmation"""
+    text = message.text or ""
+    if text == BTN_CANCEL:
+        await state.finish()
+        await message.answer("Рассылка отменена", reply_markup=get_admin_menu())
+        return
+    if not text.strip():
+        await message.answer(f"❌ Рассылка поддерживает только текст. Введите текст рассылки или «{BTN_CANCEL}»:")
+        return
+    if len(text) > MESSAGE_LIMIT:
+        await message.answer(f"❌ Текст длиннее {MESSAGE_LIMIT} символов. Введите текст покороче или «{BTN_CANCEL}»:")
+        return
+
+    await state.update_data(broadcast_text=text)
+    await message.answer("Так сообщение увидят пользователи:")
+    await message.answer(text)
+    await message.answer("Отправить рассылку всем пользователям?", reply_markup=get_confirm_keyboard())
+    await AdminStates.confirming_broadcast.set()
+
+
+async def admin_broadcast_confirm(message: types.Message, state: FSMContext):
+    """Start the broadcast once the admin confirms it"""
+    data = await state.get_data()
+    await state.finish()
+
+    if message.text != BTN_CONFIRM:
+        await message.answer("Рассылка отменена", reply_markup=get_admin_menu())
+        return
+    if await _broadcast_blocked(message):
+        return
+
+    await message.answer("📣 Рассылка запущена", reply_markup=get_admin_menu())
+    broadcast = Broadcast(
+        message.bot, data["broadcast_text"], BROADCAST_CHECKPOINT_PATH, concurrency=BROADCAST_CONCURRENCY
+    )
+    await _start_broadcast(message, broadcast)
+
+
+async def admin_broadcast_resume(message: types.Message):
+    """Continue a broadcast interrupted by a restart"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    if _broadcast_running():
+        await message.answer("⏳ Рассылка уже идет")
+        return
+
+    broadcast = Broadcast.load(message.bot, BROADCAST_CHECKPOINT_PATH, concurrency=BROADCAST_CONCURRENCY)
+    if broadcast is None:
+        await message.answer("Нет незавершенной рассылки")
+        return
+
+    await _start_broadcast(message, broadcast)
+
+
+async def admin_broadcast_discard(message: types.Message):
+    """Drop an unfinished broadcast instead of resuming it"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    if _broadcast_running():
+        await message.answer("⏳ Рассылка уже идет")
+        return
+
+    if Broadcast.discard(BROADCAST_CHECKPOINT_PATH):
+        await message.answer("🗑 Незавершенная рассылка удалена")
+    else:
+        await message.answer("Нет незавершенной рассылки")
+
+
+def register_handlers(dp: Dispatcher, router: ButtonRouter):
     """Register admin handlers"""
     # Admin command
     dp.register_message_handler(cmd_admin, IDFilter(user_id=ADMIN_IDS), commands=["admin"])
+    dp.register_message_handler(admin_refresh_servers, IDFilter(user_id=ADMIN_IDS), commands=["refresh_servers"])
+    dp.register_message_handler(admin_backend_status, IDFilter(user_id=ADMIN_IDS), commands=["backend"])
+    dp.register_message_handler(admin_stats, IDFilter(user_id=ADMIN_IDS), commands=["stats"])
+    dp.register_message_handler(admin_broadcast_start, IDFilter(user_id=ADMIN_IDS), commands=["broadcast"])
+    dp.register_message_handler(admin_broadcast_resume, IDFilter(user_id=ADMIN_IDS), commands=["broadcast_resume"])
+    dp.register_message_handler(admin_broadcast_discard, IDFilter(user_id=ADMIN_IDS), commands=["broadcast_discard"])
+    dp.register_message_handler(admin_find_user, IDFilter(user_id=ADMIN_IDS), commands=["find"])
+    dp.register_message_handler(admin_server_keys, IDFilter(user_id=ADMIN_IDS), commands=["server_keys"])
+    dp.register_message_handler(admin_active_keys, IDFilter(user_id=ADMIN_IDS), commands=["active_keys"])
+    dp.register_message_handler(admin_sync_replica, IDFilter(user_id=ADMIN_IDS), commands=["sync_replica"])
+    dp.register_message_handler(admin_export, IDFilter(user_id=ADMIN_IDS), commands=["export"])
+    dp.register_message_handler(admin_bulk_revoke_start, IDFilter(user_id=ADMIN_IDS), commands=["revoke_bulk"])
 
     # Admin menu handlers
-    dp.register_message_handler(admin_show_users, IDFilter(user_id=ADMIN_IDS), lambda m: m.text == "👥 Пользователи")
-    dp.register_message_handler(admin_show_servers, IDFilter(user_id=ADMIN_IDS), lambda m: m.text == "🖥️ Серверы")
-    dp.register_message_handler(admin_show_keys, IDFilter(user_id=ADMIN_IDS), lambda m: m.text == "🔑 Ключи")
-    dp.register_message_handler(admin_revoke_key_start, IDFilter(user_id=ADMIN_IDS),
-                                lambda m: m.text == "🗑️ Отозвать ключ")
+    router.add(BTN_ADMIN_USERS, admin_show_users, admin_only=True)
+    router.add(BTN_ADMIN_SERVERS, admin_show_servers, admin_only=True)
+    router.add(BTN_ADMIN_KEYS, admin_show_keys, admin_only=True)
+    router.add(BTN_ADMIN_REVOKE_KEY, admin_revoke_key_start, admin_only=True)
 
     # Admin state handlers
     dp.register_message_handler(admin_revoke_key_process, IDFilter(user_id=ADMIN_IDS),
-                                state=AdminStates.waiting_for_key_id)
\ No newline at end of file
+                                state=AdminStates.waiting_for_key_id)
+    # Any content type, so photos and stickers are rejected instead of leaving the admin stuck in the state
+    dp.register_message_handler(admin_broadcast_process, IDFilter(user_id=ADMIN_IDS),
+                                state=AdminStates.waiting_for_broadcast_text, content_types=types.ContentType.ANY)
+    dp.register_message_handler(admin_broadcast_confirm, IDFilter(user_id=ADMIN_IDS),
+                                state=AdminStates.confirming_broadcast)
+    dp.register_message_handler(admin_bulk_revoke_process, IDFilter(user_id=ADMIN_IDS),
+                                state=AdminStates.confirming_bulk_revoke)
\ No newline at end of file
@@ -1,8 +1,13 @@
+import logging
 from aiogram import Dispatcher, types
 from aiogram.dispatcher.filters import CommandStart, CommandHelp
 from keyboards.user_kb import get_main_menu
-from resources.messages import WELCOME_MESSAGE, HELP_MESSAGE
+from resources.messages import WELCOME_MESSAGE, HELP_MESSAGE, ERROR_BACKEND_UNAVAILABLE
 from utils.api import register_user
+from utils.prefetch import prefetch_user_context
+from utils.resilience import BackendUnavailable
+
+logger = logging.getLogger(__name__)
 
 
 async def cmd_start(message: types.Message):
@@ -14,6 +19,9 @@ async def cmd_start(message: types.Message):
     # Register user in the backend
     await register_user(user_id, username, first_name)
 
+    # Users usually open their keys or create one next; load both while they read
+    prefetch_user_context(user_id)
+
     # Send welcome message with main menu
     await message.answer(WELCOME_MESSAGE, reply_markup=get_main_menu())
 
@@ -23,7 +31,18 @@ async def cmd_help(message: types.Message):
     await message.answer(HELP_MESSAGE, disable_web_page_preview=True, reply_markup=get_main_menu(), parse_mode='HTML')
 
 
+async def backend_unavailable(update: types.Update, exception: BackendUnavailable):
+    """Tell the user the backend is down instead of showing empty results"""
+    logger.warning(f"Backend unavailable: {exception}")
+
+    if update.message:
+        await update.message.answer(ERROR_BACKEND_UNAVAILABLE, reply_markup=get_main_menu())
+
+    return True
+
+
 def register_handlers(dp: Dispatcher):
     """Register common handlers"""
     dp.register_message_handler(cmd_start, CommandStart())
-    dp.register_message_handler(cmd_help, CommandHelp())
\ No newline at end of file
+    dp.register_message_handler(cmd_help, CommandHelp())
+    dp.register_errors_handler(backend_unavailable, exception=BackendUnavailable)
\ No newline at end of file
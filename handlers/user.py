@@ -1,15 +1,24 @@
+import asyncio
 import logging
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from keyboards.user_kb import get_main_menu, get_servers_keyboard, get_vpn_keyboard
-from utils.api import get_user_keys, get_available_servers, create_vpn_key
-from utils.vpn import generate_vpn_qr_code
+from aiogram.utils.exceptions import TelegramAPIError
+from keyboards.buttons import BTN_GET_VPN, BTN_MY_KEYS, BTN_BACK_TO_MENU, BTN_HELP, BTN_CONFIRM
+from keyboards.user_kb import get_main_menu, get_servers_keyboard, get_vpn_keyboard, get_confirm_keyboard
+from utils.router import ButtonRouter
+from utils.api import get_user_keys, get_available_servers, find_server, create_vpn_key, server_catalogue
+from utils.prefetch import prefetch_user_context
+from utils.render import render_profile, render_key_caption, render_key_confirmation, render_key_created
+from utils.vpn import get_vpn_qr_photo, remember_qr_file_id
 from config import DEFAULT_TRAFFIC_LIMIT_GB, DEFAULT_EXPIRATION_DAYS
 from handlers.common import cmd_help
 
 logger = logging.getLogger(__name__)
 
+# Telegram allows at most 10 photos per media group
+MEDIA_GROUP_SIZE = 10
+
 
 # States for the conversation
 class VPNStates(StatesGroup):
@@ -28,33 +37,7 @@ async def cmd_profile(message: types.Message):
         await message.answer("У вас пока нет активных VPN ключей. Используйте /vpn для получения доступа.")
         return
 
-    # Prepare profile message
-    profile_text = "🔑 Ваши VPN ключи:\n\n"
-
-    for key in keys:
-        # Format expiration date and traffic info
-        expiration = key.get('expiration_date', 'Бессрочно')
-        if expiration and expiration != 'Бессрочно':
-            expiration = expiration.split('T')[0]  # Format date to YYYY-MM-DD
-
-        traffic_limit = key.get('traffic_limit', 0)
-        traffic_used = key.get('traffic_used', 0)
-
-        if traffic_limit > 0:
-            traffic_info = f"{traffic_used / (1024 ** 3):.2f} GB / {traffic_limit / (1024 ** 3):.2f} GB"
-        else:
-            traffic_info = f"{traffic_used / (1024 ** 3):.2f} GB / Безлимитно"
-
-        # Add key info to profile text
-        profile_text += (
-            f"🔸 {key['name']}\n"
-            f"📍 Сервер: {key['server_name']} ({key['server_location']})\n"
-            f"📅 Истекает: {expiration}\n"
-            f"📊 Трафик: {traffic_info}\n"
-            f"🔗 Статус: {'Активен' if key['is_active'] else 'Неактивен'}\n\n"
-        )
-
-    await message.answer(profile_text, reply_markup=get_main_menu())
+    await message.answer(render_profile(keys), reply_markup=get_main_menu())
 
 
 async def cmd_vpn(message: types.Message):
@@ -62,6 +45,9 @@ async def cmd_vpn(message: types.Message):
     # Get user's VPN keys
     keys = await get_user_keys(message.from_user.id)
 
+    # The keys are cached now; warm the server list for "Получить VPN"
+    prefetch_user_context(message.from_user.id, keys=False)
+
     if not keys:
         # User has no keys, offer to create one
         await message.answer(
@@ -84,10 +70,9 @@ async def cmd_servers(message: types.Message):
         await message.answer("В настоящее время нет доступных серверов.")
         return
 
-    text = "🌍 Доступные серверы:\n\n"
-
-    for server in servers:
-        text += f"🔹 {server['server_name']} - {server['server_location']}\n"
+    text = "🌍 Доступные серверы:\n\n" + "".join(
+        f"🔹 {server['server_name']} - {server['server_location']}\n" for server in servers
+    )
 
     await message.answer(text, reply_markup=get_main_menu())
 
@@ -102,52 +87,33 @@ async def process_create_vpn(message: types.Message, state: FSMContext):
 
     await message.answer(
         "Выберите сервер для создания VPN ключа:",
-        reply_markup=get_servers_keyboard(servers)
+        reply_markup=get_servers_keyboard(servers, version=server_catalogue.version)
     )
 
-    # Set state to wait for server selection
+    # Set state to wait for server selection; the list itself stays in the shared catalogue
     await VPNStates.selecting_server.set()
 
-    # Store servers in state data
-    await state.update_data(available_servers=servers)
-
 
 async def process_server_selection(message: types.Message, state: FSMContext):
     """Process server selection"""
-    user_data = await state.get_data()
-    servers = user_data.get('available_servers', [])
-
     # Find selected server
-    selected_server = None
-    for server in servers:
-        if server['server_name'] == message.text:
-            selected_server = server
-            break
+    selected_server = await find_server(name=message.text)
 
     if not selected_server:
+        servers = await get_available_servers()
         await message.answer(
             "Пожалуйста, выберите сервер из списка",
-            reply_markup=get_servers_keyboard(servers)
+            reply_markup=get_servers_keyboard(servers, version=server_catalogue.version)
         )
         return
 
-    # Store selected server
-    await state.update_data(selected_server=selected_server)
+    # Store only the id, the server is resolved from the catalogue again on confirmation
+    await state.update_data(server_id=selected_server['id'])
 
     # Ask for confirmation
     await message.answer(
-        f"Вы выбрали сервер: {selected_server['server_name']} ({selected_server['server_location']})\n\n"
-        f"Будет создан VPN ключ со следующими параметрами:\n"
-        f"- Трафик: {DEFAULT_TRAFFIC_LIMIT_GB} GB\n"
-        f"- Срок действия: {DEFAULT_EXPIRATION_DAYS} дней\n\n"
-        f"Подтвердить создание ключа?",
-        reply_markup=types.ReplyKeyboardMarkup(
-            keyboard=[
-                [types.KeyboardButton(text="Подтвердить")],
-                [types.KeyboardButton(text="Отмена")]
-            ],
-            resize_keyboard=True
-        )
+        render_key_confirmation(selected_server, DEFAULT_TRAFFIC_LIMIT_GB, DEFAULT_EXPIRATION_DAYS),
+        reply_markup=get_confirm_keyboard()
     )
 
     # Set state to wait for confirmation
@@ -156,13 +122,13 @@ async def process_server_selection(message: types.Message, state: FSMContext):
 
 async def process_key_confirmation(message: types.Message, state: FSMContext):
     """Process key creation confirmation"""
-    if message.text != "Подтвердить":
+    if message.text != BTN_CONFIRM:
         await message.answer("Создание ключа отменено", reply_markup=get_main_menu())
         await state.finish()
         return
 
     user_data = await state.get_data()
-    selected_server = user_data.get('selected_server')
+    selected_server = await find_server(server_id=user_data.get('server_id'))
 
     if not selected_server:
         await message.answer("Ошибка: сервер не выбран", reply_markup=get_main_menu())
@@ -183,27 +149,18 @@ async def process_key_confirmation(message: types.Message, state: FSMContext):
         )
 
         # Generate QR code
-        qr_image = generate_vpn_qr_code(key_data['access_url'])
-
-        from aiogram.utils.markdown import escape_md
-
-        # access_url = escape_md(key_data['access_url'])
+        qr_image = await get_vpn_qr_photo(key_data['access_url'])
 
-        caption = (
-            f"✅ <b>VPN ключ успешно создан!</b>\n\n"
-            f"📍 <b>Сервер:</b> {selected_server['server_name']} ({selected_server['server_location']})\n"
-            f"📅 <b>Срок действия:</b> {DEFAULT_EXPIRATION_DAYS} дней\n"
-            f"📊 <b>Трафик:</b> {DEFAULT_TRAFFIC_LIMIT_GB} GB\n\n"
-            f"🔑 <b>Конфигурация:</b>\n"
-            f"Ссылка <b>на конфигурацию:</b> <code>{key_data['access_url']}</code>\n\n"
-            f"Отсканируйте QR-код или скопируйте конфигурацию для настройки VPN-клиента."
+        caption = render_key_created(
+            selected_server, key_data['access_url'], DEFAULT_TRAFFIC_LIMIT_GB, DEFAULT_EXPIRATION_DAYS
         )
-        await message.answer_photo(
+        sent = await message.answer_photo(
             qr_image,
             caption=caption,
             parse_mode=types.ParseMode.HTML,
             reply_markup=get_main_menu()
         )
+        remember_qr_file_id(key_data['access_url'], sent)
 
         # Delete processing message
         await processing_msg.delete()
@@ -219,6 +176,39 @@ async def process_key_confirmation(message: types.Message, state: FSMContext):
     await state.finish()
 
 
+async def _send_key_photo(message: types.Message, key, photo):
+    """Send a single key card with its QR code"""
+    sent = await message.answer_photo(
+        photo,
+        caption=render_key_caption(key),
+        parse_mode=types.ParseMode.MARKDOWN
+    )
+    remember_qr_file_id(key['access_url'], sent)
+
+
+async def _send_key_batch(message: types.Message, batch):
+    """Send up to MEDIA_GROUP_SIZE key cards as one album, falling back to single photos"""
+    if len(batch) == 1:
+        key, photo = batch[0]
+        await _send_key_photo(message, key, photo)
+        return
+
+    media = types.MediaGroup()
+    for key, photo in batch:
+        media.attach_photo(photo, caption=render_key_caption(key), parse_mode=types.ParseMode.MARKDOWN)
+
+    try:
+        sent_messages = await message.answer_media_group(media)
+    except TelegramAPIError as e:
+        logger.warning(f"Media group failed, sending keys one by one: {e}")
+        for key, _ in batch:
+            await _send_key_photo(message, key, await get_vpn_qr_photo(key['access_url']))
+        return
+
+    for (key, _), sent in zip(batch, sent_messages):
+        remember_qr_file_id(key['access_url'], sent)
+
+
 async def process_show_keys(message: types.Message):
     """Process show VPN keys button click"""
     # Get user's VPN keys
@@ -231,40 +221,15 @@ async def process_show_keys(message: types.Message):
         )
         return
 
-    # Send each key as a separate message with QR code
-    for key in keys:
-        if not key['is_active']:
-            continue
-
-        # Generate QR code
-        qr_image = generate_vpn_qr_code(key['access_url'])
-
-        # Format expiration date and traffic info
-        expiration = key.get('expiration_date', 'Бессрочно')
-        if expiration and expiration != 'Бессрочно':
-            expiration = expiration.split('T')[0]  # Format date to YYYY-MM-DD
+    active_keys = [key for key in keys if key['is_active']]
 
-        traffic_limit = key.get('traffic_limit', 0)
-        traffic_used = key.get('traffic_used', 0)
+    # Render QR codes concurrently (or reuse already uploaded ones)
+    photos = await asyncio.gather(*(get_vpn_qr_photo(key['access_url']) for key in active_keys))
+    cards = list(zip(active_keys, photos))
 
-        if traffic_limit > 0:
-            traffic_info = f"{traffic_used / (1024 ** 3):.2f} GB / {traffic_limit / (1024 ** 3):.2f} GB"
-        else:
-            traffic_info = f"{traffic_used / (1024 ** 3):.2f} GB / Безлимитно"
-
-        # Send key info with QR code
-        await message.answer_photo(
-            qr_image,
-            caption=(
-                f"🔑 VPN ключ: {key['name']}\n"
-                f"📍 Сервер: {key['server_name']} ({key['server_location']})\n"
-                f"📅 Истекает: {expiration}\n"
-                f"📊 Трафик: {traffic_info}\n\n"
-                f"🔗 Конфигурация:\n"
-                f"`{key['access_url']}`"
-            ),
-            parse_mode=types.ParseMode.MARKDOWN
-        )
+    # Send keys as albums of up to MEDIA_GROUP_SIZE photos
+    for start in range(0, len(cards), MEDIA_GROUP_SIZE):
+        await _send_key_batch(message, cards[start:start + MEDIA_GROUP_SIZE])
 
     await message.answer(
         "Выберите действие:",
@@ -279,7 +244,7 @@ async def process_back_to_menu(message: types.Message):
     )
 
 
-def register_handlers(dp: Dispatcher):
+def register_handlers(dp: Dispatcher, router: ButtonRouter):
     """Register user handlers"""
     # Commands
     dp.register_message_handler(cmd_profile, commands=["profile"])
@@ -287,10 +252,10 @@ def register_handlers(dp: Dispatcher):
     dp.register_message_handler(cmd_servers, commands=["servers"])
 
     # Button clicks
-    dp.register_message_handler(process_create_vpn, lambda m: m.text == "Получить VPN")
-    dp.register_message_handler(process_show_keys, lambda m: m.text == "Мои VPN ключи")
-    dp.register_message_handler(process_back_to_menu, lambda m: m.text == "Вернуться в меню")
-    dp.register_message_handler(cmd_help, lambda m: m.text == "Помощь")
+    router.add(BTN_GET_VPN, process_create_vpn)
+    router.add(BTN_MY_KEYS, process_show_keys)
+    router.add(BTN_BACK_TO_MENU, process_back_to_menu)
+    router.add(BTN_HELP, cmd_help)
 
 
     # State handlers
@@ -1,9 +1,12 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from keyboards.buttons import BTN_ADMIN_USERS, BTN_ADMIN_SERVERS, BTN_ADMIN_KEYS, BTN_ADMIN_REVOKE_KEY, BTN_BACK_TO_MENU
+from utils.render import FrozenKeyboard
+
+ADMIN_MENU = FrozenKeyboard([
+    [BTN_ADMIN_USERS, BTN_ADMIN_SERVERS],
+    [BTN_ADMIN_KEYS, BTN_ADMIN_REVOKE_KEY],
+    [BTN_BACK_TO_MENU],
+])
 
 def get_admin_menu():
     """Return admin menu keyboard"""
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.row(KeyboardButton("👥 Пользователи"), KeyboardButton("🖥️ Серверы"))
-    keyboard.row(KeyboardButton("🔑 Ключи"), KeyboardButton("🗑️ Отозвать ключ"))
-    keyboard.row(KeyboardButton("Вернуться в меню"))
-    return keyboard
\ No newline at end of file
+    return ADMIN_MENU
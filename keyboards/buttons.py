@@ -0,0 +1,19 @@
+"""Reply keyboard button labels, shared by the keyboards and the button router"""
+
+# User menu
+BTN_GET_VPN = "Получить VPN"
+BTN_MY_KEYS = "Мои VPN ключи"
+BTN_HELP = "Помощь"
+BTN_PROFILE = "Профиль"
+BTN_SHOW_QR = "Показать QR-коды"
+BTN_BACK_TO_MENU = "Вернуться в меню"
+
+# Key creation
+BTN_CONFIRM = "Подтвердить"
+BTN_CANCEL = "Отмена"
+
+# Admin menu
+BTN_ADMIN_USERS = "👥 Пользователи"
+BTN_ADMIN_SERVERS = "🖥️ Серверы"
+BTN_ADMIN_KEYS = "🔑 Ключи"
+BTN_ADMIN_REVOKE_KEY = "🗑️ Отозвать ключ"
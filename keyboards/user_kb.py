@@ -1,33 +1,45 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from keyboards.buttons import (
+    BTN_GET_VPN, BTN_MY_KEYS, BTN_HELP, BTN_PROFILE, BTN_SHOW_QR, BTN_BACK_TO_MENU, BTN_CONFIRM, BTN_CANCEL,
+)
+from utils.render import FrozenKeyboard
+
+# Static keyboards are built once and shared by all replies
+MAIN_MENU = FrozenKeyboard([[BTN_GET_VPN, BTN_MY_KEYS], [BTN_HELP, BTN_PROFILE]])
+VPN_KEYBOARD_WITH_KEYS = FrozenKeyboard([[BTN_SHOW_QR], [BTN_BACK_TO_MENU]])
+VPN_KEYBOARD_NO_KEYS = FrozenKeyboard([[BTN_GET_VPN], [BTN_BACK_TO_MENU]])
+CONFIRM_KEYBOARD = FrozenKeyboard([[BTN_CONFIRM], [BTN_CANCEL]])
+
+# (catalogue version, keyboard) of the last server keyboard built
+_servers_keyboard = (None, None)
 
 
 def get_main_menu():
     """Return main menu keyboard"""
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.row(KeyboardButton("Получить VPN"), KeyboardButton("Мои VPN ключи"))
-    keyboard.row(KeyboardButton("Помощь"), KeyboardButton("Профиль"))
-    return keyboard
+    return MAIN_MENU
 
 
 def get_vpn_keyboard(has_keys=False):
     """Return VPN management keyboard"""
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    return VPN_KEYBOARD_WITH_KEYS if has_keys else VPN_KEYBOARD_NO_KEYS
 
-    if has_keys:
-        keyboard.row(KeyboardButton("Показать QR-коды"))
-    else:
-        keyboard.row(KeyboardButton("Получить VPN"))
 
-    keyboard.row(KeyboardButton("Вернуться в меню"))
-    return keyboard
+def get_servers_keyboard(servers, version=None):
+    """Return keyboard with server selection.
+
+    Pass the server catalogue version the list came from to reuse the
+    keyboard until the catalogue changes.
+    """
+    global _servers_keyboard
 
+    if version is not None and _servers_keyboard[0] == version:
+        return _servers_keyboard[1]
 
-def get_servers_keyboard(servers):
-    """Return keyboard with server selection"""
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard = FrozenKeyboard([[server["server_name"]] for server in servers] + [[BTN_CANCEL]])
+    if version is not None:
+        _servers_keyboard = (version, keyboard)
+    return keyboard
 
-    for server in servers:
-        keyboard.add(KeyboardButton(server["server_name"]))
 
-    keyboard.row(KeyboardButton("Отмена"))
-    return keyboard
\ No newline at end of file
+def get_confirm_keyboard():
+    """Return key creation confirmation keyboard"""
+    return CONFIRM_KEYBOARD
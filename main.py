@@ -1,9 +1,27 @@
 import logging
 import asyncio
+import os
+import signal
+from aiohttp import web
 from aiogram import Bot, Dispatcher, executor
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
-from config import BOT_TOKEN, LOG_LEVEL
+from config import (
+    BOT_TOKEN, LOG_LEVEL, SERVER_CATALOGUE_REFRESH_INTERVAL, RUN_MODE,
+    WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_MAX_IN_FLIGHT,
+    SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES, METRICS_PORT,
+    KEY_SYNC_INTERVAL, KEY_SYNC_CURSOR, KEY_SYNC_STATE_PATH, KEY_ALERT_TRAFFIC_THRESHOLDS, KEY_ALERT_EXPIRY_DAYS,
+    BROADCAST_CONCURRENCY, REPLICA_PATH, REPLICA_SYNC_INTERVAL,
+    SHARD_SOURCE, SHARD_WORKERS, SHARD_QUEUE_SIZE, FSM_STORAGE,
+)
 from handlers import register_all_handlers
+from utils.api import close_session, server_catalogue
+from utils.key_sync import KeySync, parse_thresholds
+from utils.metrics import MetricsMiddleware, metrics_view, monitor_loop_lag, registry, start_metrics_server
+from utils.replica import replica
+from utils.sender import SendScheduler, SharedTokenBucket, ThrottledBot
+from utils.shards import ShardRouter, ShardWorker, start_workers
+from utils.storage import create_storage
+from utils.vpn import shutdown_qr_pool
+from utils.webhook import create_webhook_app
 
 # Configure logging
 logging.basicConfig(
@@ -12,32 +30,216 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
 
 
-async def on_startup(dispatcher):
+def create_scheduler(global_bucket=None):
+    return SendScheduler(
+        global_rate=SEND_GLOBAL_RATE,
+        chat_rate=SEND_CHAT_RATE,
+        chat_burst=SEND_CHAT_BURST,
+        max_retries=SEND_MAX_RETRIES,
+        global_bucket=global_bucket,
+    )
+
+
+# Outgoing rate limiter shared by the bot
+scheduler = create_scheduler()
+
+registry.gauge("send_queue_depth", "Outgoing Telegram calls waiting for a rate limit token",
+               lambda: {(("priority", p),): n for p, n in scheduler.stats()["queue_depth"].items()})
+
+# Background tasks and servers started in on_startup
+background = {}
+
+
+def create_bot(token=BOT_TOKEN):
+    """Create the bot with outgoing calls paced by the shared scheduler"""
+    return ThrottledBot(token=token, scheduler=scheduler)
+
+
+def create_dispatcher(bot, storage=None):
+    """Create the dispatcher with middlewares and all handlers registered"""
+    dp = Dispatcher(bot, storage=storage or create_storage())
+    dp.middleware.setup(MetricsMiddleware())
+    register_all_handlers(dp)
+    return dp
+
+
+async def set_update_source(bot):
+    """Point Telegram at the webhook or switch it off for polling"""
+    if RUN_MODE == 'webhook' or (RUN_MODE == 'sharded' and SHARD_SOURCE == 'webhook'):
+        await bot.set_webhook(
+            f"{WEBHOOK_HOST}{WEBHOOK_PATH}",
+            drop_pending_updates=True,
+            secret_token=WEBHOOK_SECRET or None,
+        )
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+
+
+async def on_startup(dispatcher, shard=None):
     """Действия при запуске бота"""
-    # Register all handlers
-    await bot.delete_webhook(drop_pending_updates=True)
-    register_all_handlers(dispatcher)
+    bot = dispatcher.bot
+    # Jobs that must not run once per process (alerts, replica sync) go to shard 0
+    primary = shard in (None, 0)
+
+    if shard is None:
+        # In sharded mode the front process owns the update source
+        await set_update_source(bot)
+
+    server_catalogue.start(SERVER_CATALOGUE_REFRESH_INTERVAL)
+    if REPLICA_SYNC_INTERVAL > 0:
+        replica.start(REPLICA_SYNC_INTERVAL, follow=not primary and REPLICA_PATH != ':memory:')
+    background['loop_lag'] = asyncio.ensure_future(monitor_loop_lag())
+
+    if KEY_SYNC_INTERVAL > 0 and primary:
+        background['key_sync'] = KeySync(
+            bot,
+            KEY_SYNC_STATE_PATH,
+            interval=KEY_SYNC_INTERVAL,
+            traffic_thresholds=parse_thresholds(KEY_ALERT_TRAFFIC_THRESHOLDS),
+            expiry_warning=KEY_ALERT_EXPIRY_DAYS * 86400,
+            use_cursor=KEY_SYNC_CURSOR,
+            concurrency=BROADCAST_CONCURRENCY,
+        )
+        background['key_sync'].start()
+
+    if RUN_MODE != 'webhook' and METRICS_PORT:
+        # Every shard serves its own metrics on the next port
+        background['metrics'] = await start_metrics_server(WEBAPP_HOST, METRICS_PORT + (shard or 0))
 
     logger.info("Bot started")
 
 
 async def on_shutdown(dispatcher):
     """Действия при остановке бота"""
+    background.pop('loop_lag').cancel()
+    if 'key_sync' in background:
+        await background.pop('key_sync').stop()
+    if 'metrics' in background:
+        await background.pop('metrics').cleanup()
+    await server_catalogue.stop()
+    await replica.stop()
+    await scheduler.close()
     await dispatcher.storage.close()
     await dispatcher.storage.wait_closed()
+    await close_session()
+    shutdown_qr_pool()
 
     logger.info("Bot stopped")
 
 
+def run_webhook(dp):
+    """Serve updates through an aiohttp webhook endpoint"""
+    app = create_webhook_app(
+        dp,
+        WEBHOOK_PATH,
+        max_in_flight=WEBHOOK_MAX_IN_FLIGHT,
+        secret_token=WEBHOOK_SECRET or None,
+        on_startup=on_startup,
+        on_shutdown=on_shutdown,
+    )
+    app.router.add_get("/metrics", metrics_view)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+
+def run_shard_worker(index, source, shards, send_budget):
+    """Entry point of a worker process in sharded mode"""
+    global scheduler
+
+    # Ctrl+C reaches the whole process group; the front process stops workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    # Telegram's global limit is per bot, so all workers draw from one shared bucket: the
+    # worker running a broadcast (the admin's shard) or key alerts (shard 0) gets the whole
+    # budget when the others are idle. Per-chat buckets stay per worker; a chat's replies
+    # all come from its own shard, only the rare bulk message may come from another one.
+    scheduler = create_scheduler(send_budget)
+
+    async def serve():
+        dp = create_dispatcher(create_bot())
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        await on_startup(dp, shard=index)
+        try:
+            worker = ShardWorker(dp, source, max_in_flight=WEBHOOK_MAX_IN_FLIGHT)
+            await worker.run()
+            logger.info(f"Shard {index} processed {worker.processed} updates")
+        finally:
+            await on_shutdown(dp)
+            session = await dp.bot.get_session()
+            await session.close()
+
+    asyncio.run(serve())
+
+
+async def _run_front(router, processes):
+    """Receive updates and route them to the workers until stopped or a worker dies"""
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    loop.add_signal_handler(signal.SIGTERM, main_task.cancel)
+
+    bot = Bot(token=BOT_TOKEN)
+    await set_update_source(bot)
+    runner = None
+
+    if SHARD_SOURCE == 'webhook':
+        runner = web.AppRunner(router.create_webhook_app(WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None))
+        await runner.setup()
+        await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+        source = None
+    else:
+        source = asyncio.ensure_future(router.poll(bot))
+
+    try:
+        while all(process.is_alive() for process in processes):
+            await asyncio.sleep(1)
+        dead = [process.name for process in processes if not process.is_alive()]
+        logger.error(f"Worker {', '.join(dead)} exited, stopping")
+    finally:
+        if source is not None:
+            source.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        session = await bot.get_session()
+        await session.close()
+
+
+def run_sharded():
+    """Route updates by chat id to worker processes, each with its own dispatcher"""
+    shards = SHARD_WORKERS or os.cpu_count()
+    if FSM_STORAGE == 'memory':
+        logger.warning("FSM_STORAGE=memory keeps conversations inside each worker; "
+                       "use sqlite or redis to keep them across restarts and SHARD_WORKERS changes")
+
+    send_budget = SharedTokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+    processes, queues = start_workers(run_shard_worker, shards, send_budget, queue_size=SHARD_QUEUE_SIZE)
+    router = ShardRouter(queues)
+    logger.info(f"Started {shards} shard workers, receiving updates via {SHARD_SOURCE}")
+
+    try:
+        asyncio.run(_run_front(router, processes))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        router.stop()
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        logger.info(f"Bot stopped, routed updates per shard: {router.routed}")
+
+
 if __name__ == '__main__':
     try:
         # Start the bot
-        executor.start_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown, skip_updates=True)
+        if RUN_MODE == 'sharded':
+            run_sharded()
+        elif RUN_MODE == 'webhook':
+            run_webhook(create_dispatcher(create_bot()))
+        else:
+            dp = create_dispatcher(create_bot())
+            executor.start_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown, skip_updates=True)
     except Exception as e:
         logger.error(f"Bot error: {e}")
\ No newline at end of file
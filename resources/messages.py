@@ -27,3 +27,9 @@ HELP_MESSAGE = """
 # Error messages
 ERROR_NO_SERVERS = "В настоящее время нет доступных серверов. Пожалуйста, попробуйте позже."
 ERROR_CREATING_KEY = "❌ Ошибка при создании VPN ключа. Пожалуйста, попробуйте еще раз позже."
+ERROR_BACKEND_UNAVAILABLE = "⚠️ Сервис временно недоступен. Пожалуйста, попробуйте еще раз через несколько минут."
+
+# Key alerts sent by the key sync engine
+ALERT_TRAFFIC = "⚠️ Ключ {name} ({server_name}) израсходовал {percent}% трафика: {traffic}."
+ALERT_TRAFFIC_EXHAUSTED = "⛔ Ключ {name} ({server_name}) израсходовал весь трафик: {traffic}. Создайте новый ключ в /vpn."
+ALERT_EXPIRY = "⏳ Ключ {name} ({server_name}) истекает {expiration} (осталось дней: {days}). Создайте новый ключ в /vpn."
@@ -1,22 +1,266 @@
-import logging
-import requests
+import asyncio
 import json
-from config import API_URL, API_USERNAME, API_PASSWORD
+import logging
+import re
+import time
+from collections import defaultdict
+import aiohttp
+from config import (
+    API_URL, API_USERNAME, API_PASSWORD,
+    API_TIMEOUT, API_CONNECT_TIMEOUT, API_KEEPALIVE_TIMEOUT,
+    API_MAX_CONNECTIONS, API_MAX_CONCURRENCY,
+    USER_CACHE_SIZE, USER_CACHE_TTL, SERVER_CATALOGUE_TTL,
+    API_ENDPOINT_TIMEOUTS, API_MAX_RETRIES, API_RETRY_BACKOFF, API_RETRY_BACKOFF_MAX, API_RETRY_BUDGET_RATIO,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT, KEYS_FALLBACK_TTL, KEYS_CACHE_TTL,
+)
+from utils.cache import TTLCache
+from utils.catalogue import ServerCatalogue
+from utils.metrics import backend_seconds, registry
+from utils.resilience import BackendUnavailable, CircuitBreaker, RetryBudget, backoff_delay, parse_timeouts
 
 logger = logging.getLogger(__name__)
 
-# Session for API requests
-session = requests.Session()
-# session.auth = (API_USERNAME, API_PASSWORD)
+# Shared HTTP session and concurrency limit, created lazily inside the running loop
+_session = None
+_semaphore = None
+
+# Identical GETs in flight share one request: url -> future
+_inflight = {}
+# endpoint -> {"requests": n, "coalesced": n}
+coalesce_stats = defaultdict(lambda: {"requests": 0, "coalesced": 0})
+
+# Failure handling: per-endpoint deadlines, bounded retries and a circuit breaker
+endpoint_timeouts = parse_timeouts(API_ENDPOINT_TIMEOUTS)
+breaker = CircuitBreaker(failure_threshold=BREAKER_FAILURE_THRESHOLD, recovery_timeout=BREAKER_RECOVERY_TIMEOUT)
+retry_budget = RetryBudget(ratio=API_RETRY_BUDGET_RATIO)
+
+# telegram_id -> backend user id, filled by register_user and lookups
+user_id_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+# telegram_id -> last keys received, served while the backend is down
+last_known_keys = TTLCache(maxsize=USER_CACHE_SIZE, ttl=KEYS_FALLBACK_TTL)
+# telegram_id -> keys, short-lived, warmed by utils.prefetch and dropped on key mutations
+user_keys_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=KEYS_CACHE_TTL)
+# key id -> telegram_id of its owner, to invalidate user_keys_cache on revoke
+key_owners = TTLCache(maxsize=USER_CACHE_SIZE, ttl=KEYS_FALLBACK_TTL)
+# telegram_id -> generation of the user's keys, bumped by invalidate_user_keys, so
+# a read that started before a mutation doesn't cache what it got
+keys_generations = TTLCache(maxsize=USER_CACHE_SIZE, ttl=KEYS_FALLBACK_TTL)
+# Bumped when the keys of all users are invalidated at once
+_keys_epoch = 0
+
+registry.gauge("backend_circuit_open", "1 while the backend circuit breaker is not closed",
+               lambda: int(breaker.state != CircuitBreaker.CLOSED))
+registry.gauge("user_id_cache_hits", "telegram_id resolution cache hits/misses",
+               lambda: {(("result", "hit"),): user_id_cache.hits, (("result", "miss"),): user_id_cache.misses})
+registry.gauge("backend_coalesced_requests", "GET requests served by an identical in-flight request",
+               lambda: {(("endpoint", endpoint),): stats["coalesced"] for endpoint, stats in coalesce_stats.items()})
+
+
+async def get_session():
+    """Return the shared aiohttp session, creating it on first use"""
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=API_MAX_CONNECTIONS,
+            keepalive_timeout=API_KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=API_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            # auth=aiohttp.BasicAuth(API_USERNAME, API_PASSWORD),
+        )
+
+    return _session
+
+
+async def close_session():
+    """Close the shared HTTP session (called on bot shutdown)"""
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def _get_semaphore():
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def _endpoint(url):
+    """Reduce a request URL to a low-cardinality endpoint label, e.g. /users/{id}/keys/"""
+    path = url[len(API_URL):] if url.startswith(API_URL) else url
+    path = path.split('?', 1)[0]
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+async def _send_once(method, url, timeout, **kwargs):
+    session = await get_session()
+    status = "error"
+    started = time.perf_counter()
+
+    try:
+        async with _get_semaphore():
+            async with session.request(method, url, timeout=timeout, **kwargs) as response:
+                status = response.status
+                text = await response.text()
+                try:
+                    data = json.loads(text)
+                except ValueError:
+                    data = text
+                return response.status, data
+    finally:
+        backend_seconds.observe(time.perf_counter() - started, method=method, endpoint=_endpoint(url), status=status)
+
+
+async def _send(method, url, **kwargs):
+    """Send a request through the circuit breaker, retrying idempotent GETs.
+
+    Raises BackendUnavailable on connection errors, timeouts and 5xx
+    responses once retries (bounded by the retry budget) are exhausted.
+    """
+    endpoint = _endpoint(url)
+
+    if not breaker.allow():
+        raise BackendUnavailable(f"Circuit breaker is {breaker.state}")
+
+    timeout = aiohttp.ClientTimeout(total=endpoint_timeouts.get(endpoint, API_TIMEOUT), connect=API_CONNECT_TIMEOUT)
+    retry_budget.deposit()
+    attempt = 0
+
+    while True:
+        try:
+            status, data = await _send_once(method, url, timeout, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = f"{type(e).__name__}: {e}"
+        else:
+            if status < 500:
+                breaker.record_success()
+                return status, data
+            error = f"HTTP {status}"
+
+        if method == "GET" and attempt < API_MAX_RETRIES and retry_budget.withdraw():
+            await asyncio.sleep(backoff_delay(attempt, API_RETRY_BACKOFF, API_RETRY_BACKOFF_MAX))
+            attempt += 1
+            continue
+
+        breaker.record_failure()
+        raise BackendUnavailable(f"{method} {endpoint} failed: {error}")
+
+
+def _drop_inflight(matches):
+    """Make later GETs of matching URLs start a new request instead of joining one in flight.
+
+    Callers already waiting still get the result of their request.
+    """
+    for url in [url for url in _inflight if matches(url)]:
+        del _inflight[url]
+
+
+def _forget_inflight(url, future):
+    if _inflight.get(url) is future:
+        del _inflight[url]
+    # Mark the exception as retrieved even if every waiter was cancelled
+    if not future.cancelled():
+        future.exception()
+
+
+async def _request(method, path, **kwargs):
+    """Perform a backend request and return (status, decoded body).
+
+    ``path`` is relative to API_URL, absolute URLs (pagination links) are used as is.
+    Concurrent GETs of the same URL are coalesced into a single backend call,
+    so callers must treat the returned data as read-only.
+    """
+    url = path if path.startswith(("http://", "https://")) else f"{API_URL}{path}"
+
+    if method != "GET":
+        return await _send(method, url, **kwargs)
+
+    stats = coalesce_stats[_endpoint(url)]
+    stats["requests"] += 1
+
+    future = _inflight.get(url)
+    if future is not None:
+        stats["coalesced"] += 1
+    else:
+        future = asyncio.ensure_future(_send(method, url, **kwargs))
+        _inflight[url] = future
+        future.add_done_callback(lambda f: _forget_inflight(url, f))
+
+    return await asyncio.shield(future)
+
+
+async def fetch_page(url):
+    """Load one page of a backend list and return (results, next page url)"""
+    status, data = await _request("GET", url)
+
+    if status != 200:
+        raise ValueError(f"Failed to load {url}: {status} {data}")
+
+    # Unpaginated endpoints return a plain list
+    if isinstance(data, list):
+        return data, None
+
+    return data.get('results', []), data.get('next')
+
+
+async def iter_pages(path):
+    """Walk a paginated backend list lazily, yielding one page of results at a time"""
+    url = path
+
+    while url:
+        results, url = await fetch_page(url)
+        yield results
+
+
+async def _iter_items(path):
+    async for page in iter_pages(path):
+        for item in page:
+            yield item
+
+
+def iter_users():
+    """Yield every backend user, page by page"""
+    return _iter_items("/users/")
+
+
+def iter_servers():
+    """Yield every backend server, page by page"""
+    return _iter_items("/servers/")
+
+
+def iter_keys():
+    """Yield every backend key, page by page"""
+    return _iter_items("/keys/")
+
+
+async def _resolve_user_id(telegram_id):
+    """Map a Telegram id to the backend user id, using the identity cache"""
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+
+    status, data = await _request("GET", f"/users/?telegram_id={telegram_id}")
+    if status != 200 or not isinstance(data, (dict, list)):
+        raise ValueError(f"Failed to look up user {telegram_id}: {status} {data}")
+    users = data if isinstance(data, list) else data.get('results', [])
+
+    if not users:
+        return None
+
+    user_id = users[0]['id']
+    user_id_cache.set(telegram_id, user_id)
+    return user_id
 
 
 async def register_user(telegram_id, username=None, first_name=None):
     """Register or update user in the backend"""
     try:
-        # Check if user already exists
-        response = session.get(f"{API_URL}/users/?telegram_id={telegram_id}")
-        users = response.json().get('results', [])
-
         user_data = {
             "telegram_id": telegram_id,
             "username": username,
@@ -24,51 +268,163 @@ async def register_user(telegram_id, username=None, first_name=None):
             "is_active": True
         }
 
-        if users:
+        # Check if user already exists
+        user_id = await _resolve_user_id(telegram_id)
+
+        if user_id is not None:
             # Update existing user
-            user_id = users[0]['id']
-            response = session.patch(f"{API_URL}/users/{user_id}/", json=user_data)
-            return response.json()
-        else:
-            # Create new user
-            response = session.post(f"{API_URL}/users/", json=user_data)
-            return response.json()
+            status, data = await _request("PATCH", f"/users/{user_id}/", json=user_data)
+            if status != 404:
+                return data
+
+            # Cached id points to a deleted user, create it again
+            user_id_cache.pop(telegram_id)
+
+        # Create new user
+        status, data = await _request("POST", "/users/", json=user_data)
+        if isinstance(data, dict) and 'id' in data:
+            user_id_cache.set(telegram_id, data['id'])
+        return data
 
     except Exception as e:
         logger.error(f"Error registering user: {e}")
         return None
 
 
-async def get_user_keys(telegram_id):
-    """Get VPN keys for a user"""
-    try:
-        # First get user ID from telegram_id
-        response = session.get(f"{API_URL}/users/?telegram_id={telegram_id}")
-        users = response.json().get('results', [])
+def _keys_generation(telegram_id):
+    return _keys_epoch, keys_generations.get(telegram_id, 0)
+
+
+def invalidate_user_keys(telegram_id=None):
+    """Drop the cached keys of a user (of every user if None) after they changed"""
+    global _keys_epoch
+
+    # Reads already in flight may predate the change, later ones must not join them
+    if telegram_id is None:
+        _keys_epoch += 1
+        user_keys_cache.clear()
+        _drop_inflight(lambda url: _endpoint(url) == "/users/{id}/keys/")
+        return
+
+    keys_generations.set(telegram_id, keys_generations.get(telegram_id, 0) + 1)
+    user_keys_cache.pop(telegram_id)
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        keys_url = f"{API_URL}/users/{user_id}/keys/"
+        _drop_inflight(lambda url: url == keys_url)
 
-        if not users:
-            return []
 
-        user_id = users[0]['id']
+async def _fetch_user_keys(telegram_id):
+    """Load a user's keys; None if the backend has no such user, raises on any other failure"""
+    # First get user ID from telegram_id
+    user_id = await _resolve_user_id(telegram_id)
 
-        # Get keys for this user
-        response = session.get(f"{API_URL}/users/{user_id}/keys/")
-        return response.json()
+    if user_id is None:
+        return None
+
+    # Get keys for this user
+    status, data = await _request("GET", f"/users/{user_id}/keys/")
+
+    if status == 404:
+        # Stale cache entry, resolve the id once more
+        user_id_cache.pop(telegram_id)
+        user_id = await _resolve_user_id(telegram_id)
+        if user_id is None:
+            return None
+        status, data = await _request("GET", f"/users/{user_id}/keys/")
+        if status == 404:
+            # Deleted in between
+            return None
+
+    if status != 200 or not isinstance(data, list):
+        raise ValueError(f"Failed to load keys of user {telegram_id}: {status} {data}")
+    return data
+
+
+async def get_user_keys(telegram_id, fresh=False):
+    """Get VPN keys for a user.
+
+    Keys fetched within the last KEYS_CACHE_TTL seconds (e.g. prefetched on
+    /start) are served from memory unless ``fresh`` is set.
+
+    An empty list means the backend has no keys (or no such user). When the
+    backend is unavailable or answers with an error the last keys received
+    for the user are returned; without them BackendUnavailable is raised,
+    so users are not told they have no keys.
+    """
+    if not fresh:
+        keys = user_keys_cache.get(telegram_id)
+        if keys is not None:
+            return keys
+
+    generation = _keys_generation(telegram_id)
+    try:
+        data = await _fetch_user_keys(telegram_id)
 
     except Exception as e:
+        keys = last_known_keys.get(telegram_id)
+        if keys is not None:
+            logger.warning(f"Serving cached keys for {telegram_id}: {e}")
+            return keys
+        if isinstance(e, BackendUnavailable):
+            raise
         logger.error(f"Error getting user keys: {e}")
+        raise BackendUnavailable(str(e)) from e
+
+    if data is None:
         return []
 
+    if _keys_generation(telegram_id) != generation:
+        # The keys changed while we were reading them, don't cache what may predate that
+        return data
+
+    user_keys_cache.set(telegram_id, data)
+    last_known_keys.set(telegram_id, data)
+    for key in data:
+        key_owners.set(key['id'], telegram_id)
+    return data
+
+
+async def _fetch_servers():
+    """Load the full server list from the backend (raises on failure)"""
+    return [server async for server in iter_servers()]
+
+
+# Shared server list, refreshed in the background (see main.on_startup)
+server_catalogue = ServerCatalogue(_fetch_servers, ttl=SERVER_CATALOGUE_TTL)
+
+
+async def find_server(server_id=None, name=None):
+    """Look up an active server by id or name in the catalogue indexes"""
+    try:
+        await server_catalogue.get()
+
+        if server_id is not None:
+            server = server_catalogue.by_id.get(server_id)
+        else:
+            server = server_catalogue.by_name.get(name)
+
+        return server if server is not None and server['active'] else None
+
+    except BackendUnavailable:
+        raise
+
+    except Exception as e:
+        logger.error(f"Error looking up server: {e}")
+        return None
+
 
 async def get_available_servers():
     """Get list of available servers"""
     try:
-        response = session.get(f"{API_URL}/servers/")
-        servers = response.json().get('results', [])
+        servers = await server_catalogue.get()
 
         # Filter only active servers
         return [server for server in servers if server['active']]
 
+    except BackendUnavailable:
+        raise
+
     except Exception as e:
         logger.error(f"Error getting servers: {e}")
         return []
@@ -80,15 +436,12 @@ async def create_vpn_key(user_id, server_id, name, traffic_limit_gb=0, expiratio
         # Convert GB to bytes for traffic limit
         traffic_limit_bytes = int(traffic_limit_gb * (1024 ** 3)) if traffic_limit_gb > 0 else 0
 
-        # First get user's telegram_id
-        response = session.get(f"{API_URL}/users/?telegram_id={user_id}")
-        users = response.json().get('results', [])
+        # First get backend user id from telegram_id
+        backend_user_id = await _resolve_user_id(user_id)
 
-        if not users:
+        if backend_user_id is None:
             raise ValueError(f"User with telegram_id {user_id} not found")
 
-        backend_user_id = users[0]['id']
-
         # Create key
         data = {
             "user_id": backend_user_id,
@@ -98,12 +451,16 @@ async def create_vpn_key(user_id, server_id, name, traffic_limit_gb=0, expiratio
             "expiration_days": expiration_days
         }
 
-        response = session.post(f"{API_URL}/keys/create_key/", json=data)
+        status, response_data = await _request("POST", "/keys/create_key/", json=data)
+
+        if status == 404:
+            user_id_cache.pop(user_id)
 
-        if response.status_code != 201:
-            raise ValueError(f"Failed to create key: {response.text}")
+        if status != 201:
+            raise ValueError(f"Failed to create key: {response_data}")
 
-        return response.json()
+        invalidate_user_keys(user_id)
+        return response_data
 
     except Exception as e:
         logger.error(f"Error creating VPN key: {e}")
@@ -111,44 +468,51 @@ async def create_vpn_key(user_id, server_id, name, traffic_limit_gb=0, expiratio
 
 
 async def revoke_key(key_id):
-    """Revoke a VPN key"""
+    """Revoke a VPN key.
+
+    Returns False if the backend refused; BackendUnavailable is raised so
+    callers can tell transient failures apart and retry.
+    """
     try:
-        response = session.post(f"{API_URL}/keys/{key_id}/revoke/")
-        return response.status_code == 200
+        status, data = await _request("POST", f"/keys/{key_id}/revoke/")
+        if status != 200:
+            return False
 
+        owner = key_owners.pop(key_id)
+        if owner is not None:
+            invalidate_user_keys(owner)
+        else:
+            # Owner unknown, cached lists may still show the key as active
+            invalidate_user_keys()
+        return True
+
+    except BackendUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error revoking key: {e}")
         return False
 
 
-async def get_all_users():
-    """Get all users (admin function)"""
-    try:
-        response = session.get(f"{API_URL}/users/")
-        return response.json().get('results', [])
-
-    except Exception as e:
-        logger.error(f"Error getting all users: {e}")
-        return []
-
-
 async def get_all_servers():
     """Get all servers (admin function)"""
     try:
-        response = session.get(f"{API_URL}/servers/")
-        return response.json().get('results', [])
+        return list(await server_catalogue.get())
 
     except Exception as e:
         logger.error(f"Error getting all servers: {e}")
         return []
 
 
-async def get_all_keys():
-    """Get all keys (admin function)"""
-    try:
-        response = session.get(f"{API_URL}/keys/")
-        return response.json().get('results', [])
+def get_cache_stats():
+    """Return identity and keys cache hit/miss counters"""
+    return {"user_id": user_id_cache.stats(), "user_keys": user_keys_cache.stats()}
 
-    except Exception as e:
-        logger.error(f"Error getting all keys: {e}")
-        return []
\ No newline at end of file
+
+def get_coalesce_stats():
+    """Return per-endpoint counts of GETs and how many of them were coalesced"""
+    return {endpoint: dict(stats) for endpoint, stats in coalesce_stats.items()}
+
+
+def get_backend_status():
+    """Return circuit breaker and retry budget state for admins"""
+    return {"breaker": breaker.stats(), "retry_budget": retry_budget.stats()}
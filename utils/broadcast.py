@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from aiogram.utils.exceptions import (
+    BotBlocked, ChatNotFound, UserDeactivated, CantInitiateConversation, TelegramAPIError,
+)
+from utils.api import fetch_page
+from utils.sender import bulk_sending
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the user can't receive messages from the bot at all
+UNREACHABLE_ERRORS = (BotBlocked, ChatNotFound, UserDeactivated, CantInitiateConversation)
+
+
+class Broadcast:
+    """Sends one text to every backend user, page by page.
+
+    Progress is checkpointed to ``checkpoint_path`` after each page, so a
+    broadcast interrupted by a crash continues from the next unfinished
+    page (users of that page may receive the message twice). Sending rate
+    is left to the bot's SendScheduler; messages go out with bulk
+    priority so interactive replies are not starved.
+    """
+
+    def __init__(self, bot, text, checkpoint_path, concurrency=20, state=None):
+        self.bot = bot
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        # A new broadcast must not overwrite the checkpoint of an unfinished one
+        self.resumed = state is not None
+        self.state = state or {
+            "text": text,
+            "cursor": "/users/",
+            "delivered": 0,
+            "failed": 0,
+            "skipped": 0,
+            "started_at": time.time(),
+        }
+
+    @classmethod
+    def load(cls, bot, checkpoint_path, concurrency=20):
+        """Restore an unfinished broadcast from its checkpoint, if any"""
+        if not os.path.exists(checkpoint_path):
+            return None
+
+        with open(checkpoint_path, encoding="utf-8") as f:
+            state = json.load(f)
+        return cls(bot, state["text"], checkpoint_path, concurrency=concurrency, state=state)
+
+    @staticmethod
+    def discard(checkpoint_path):
+        """Drop the checkpoint of an unfinished broadcast, return False if there was none"""
+        if not os.path.exists(checkpoint_path):
+            return False
+        os.remove(checkpoint_path)
+        return True
+
+    @property
+    def processed(self):
+        return self.state["delivered"] + self.state["failed"] + self.state["skipped"]
+
+    def _save(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def _send(self, semaphore, user):
+        if not user.get("is_active", True):
+            self.state["skipped"] += 1
+            return
+
+        async with semaphore:
+            try:
+                await self.bot.send_message(user["telegram_id"], self.state["text"])
+                self.state["delivered"] += 1
+            except UNREACHABLE_ERRORS:
+                self.state["skipped"] += 1
+            except TelegramAPIError as e:
+                logger.warning(f"Broadcast to {user['telegram_id']} failed: {e}")
+                self.state["failed"] += 1
+
+    async def run(self, on_progress=None):
+        """Deliver the broadcast, calling ``on_progress(self)`` after every page"""
+        if not self.resumed and os.path.exists(self.checkpoint_path):
+            raise FileExistsError(f"Unfinished broadcast in {self.checkpoint_path}, resume or discard it first")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._save()
+        self.resumed = True
+
+        with bulk_sending():
+            while self.state["cursor"]:
+                users, next_url = await fetch_page(self.state["cursor"])
+                await asyncio.gather(*(self._send(semaphore, user) for user in users))
+
+                self.state["cursor"] = next_url
+                self._save()
+
+                if on_progress is not None:
+                    await on_progress(self)
+
+        os.remove(self.checkpoint_path)
+        return self.state
@@ -0,0 +1,168 @@
+import asyncio
+import csv
+import io
+import logging
+import time
+from utils.api import breaker, iter_keys, revoke_key
+from utils.key_sync import parse_timestamp
+from utils.metrics import registry
+from utils.resilience import BackendUnavailable, CircuitBreaker, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+bulk_revoked = registry.counter("bulk_revoked_keys_total", "Keys processed by admin bulk revocation")
+
+SCOPES = ("user", "server", "expired", "over_quota")
+
+REPORT_COLUMNS = ("id", "user_telegram_id", "server_name", "name", "result", "attempts", "error")
+
+
+class _Stopped(Exception):
+    """The run was stopped because the backend stayed unavailable"""
+
+
+def _is_expired(key, now):
+    expires_at = parse_timestamp(key.get("expiration_date"))
+    return expires_at is not None and expires_at <= now
+
+
+def _is_over_quota(key):
+    limit = key.get("traffic_limit") or 0
+    return limit > 0 and (key.get("traffic_used") or 0) >= limit
+
+
+def key_filter(scope, arg=None):
+    """Return a predicate selecting the active keys of one bulk scope"""
+    if scope == "user":
+        telegram_id = int(arg)
+        return lambda key: key.get("user_telegram_id") == telegram_id
+    if scope == "server":
+        if not arg:
+            raise ValueError("Server name is required")
+        return lambda key: key.get("server_name") == arg
+    if scope == "expired":
+        now = time.time()
+        return lambda key: _is_expired(key, now)
+    if scope == "over_quota":
+        return _is_over_quota
+    raise ValueError(f"Unknown scope: {scope}")
+
+
+async def select_keys(scope, arg=None):
+    """Collect active keys of the scope from the backend (the dry run)"""
+    matches = key_filter(scope, arg)
+    return [key async for key in iter_keys() if key.get("is_active", True) and matches(key)]
+
+
+class BulkRevoke:
+    """Revokes a list of keys concurrently.
+
+    At most ``concurrency`` revocations are in flight. Transient backend
+    failures (BackendUnavailable) are retried up to ``retries`` times with
+    jittered backoff; a refusal from the backend is final. While the
+    circuit breaker is not closed the run pauses and probes the backend
+    with one key at a time; if it stays down for longer than ``max_pause``
+    seconds the run stops and the remaining keys are reported as skipped.
+    Every key ends up in ``results`` with its outcome, which ``report()``
+    turns into CSV.
+    """
+
+    def __init__(self, keys, concurrency=5, retries=3, max_pause=300, breaker=breaker):
+        self.keys = keys
+        self.concurrency = concurrency
+        self.retries = retries
+        self.max_pause = max_pause
+        self.breaker = breaker
+        self.stopped = False
+        # key id -> (result, attempts, error)
+        self.results = {}
+        self.counts = {"revoked": 0, "refused": 0, "failed": 0, "skipped": 0}
+        self._probe_lock = asyncio.Lock()
+        self._paused_since = None
+
+    @property
+    def processed(self):
+        return len(self.results)
+
+    @property
+    def paused(self):
+        return self._paused_since is not None
+
+    async def _attempt(self, key_id):
+        if self.breaker.state == CircuitBreaker.CLOSED:
+            return await revoke_key(key_id)
+
+        # The backend is failing: wait for the breaker to let a probe through, one key at a time
+        async with self._probe_lock:
+            if self.stopped:
+                raise _Stopped()
+            if self._paused_since is None:
+                self._paused_since = time.monotonic()
+
+            if self.breaker.state == CircuitBreaker.OPEN:
+                wait = max(0, self.breaker.recovery_timeout - (time.monotonic() - self.breaker.opened_at))
+                if time.monotonic() + wait - self._paused_since > self.max_pause:
+                    self.stopped = True
+                    logger.error(f"Backend unavailable for over {self.max_pause}s, stopping bulk revoke")
+                    raise _Stopped()
+                await asyncio.sleep(wait)
+
+            try:
+                return await revoke_key(key_id)
+            finally:
+                if self.breaker.state == CircuitBreaker.CLOSED:
+                    self._paused_since = None
+
+    async def _revoke(self, semaphore, key):
+        key_id = key["id"]
+        attempt = 0
+        result, error = "skipped", ""
+
+        while not self.stopped:
+            attempt += 1
+            try:
+                async with semaphore:
+                    revoked = await self._attempt(key_id)
+            except _Stopped:
+                result, error = "skipped", ""
+                break
+            except BackendUnavailable as e:
+                result, error = "failed", str(e)
+                if attempt > self.retries:
+                    break
+            else:
+                result, error = ("revoked", "") if revoked else ("refused", "")
+                break
+            # Not holding the semaphore, so other keys go ahead meanwhile
+            await asyncio.sleep(backoff_delay(attempt - 1))
+
+        self.results[key_id] = (result, attempt, error)
+        self.counts[result] += 1
+        bulk_revoked.inc(result=result)
+
+    async def run(self, on_progress=None):
+        """Revoke all keys, calling ``on_progress(self)`` after every batch"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batch_size = self.concurrency * 10
+
+        for start in range(0, len(self.keys), batch_size):
+            await asyncio.gather(*(self._revoke(semaphore, key) for key in self.keys[start:start + batch_size]))
+            if on_progress is not None:
+                await on_progress(self)
+
+        logger.info(f"Bulk revoke finished: {self.counts}")
+        return self.counts
+
+    def report(self):
+        """Return the per-key results as CSV bytes"""
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(REPORT_COLUMNS)
+        for key in self.keys:
+            # Keys not reached by an interrupted run
+            result, attempts, error = self.results.get(key["id"], ("skipped", 0, ""))
+            writer.writerow((
+                key["id"], key.get("user_telegram_id"), key.get("server_name"), key.get("name"),
+                result, attempts, error,
+            ))
+        return text.getvalue().encode("utf-8-sig")
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ServerCatalogue:
+    """In-process copy of the backend server list.
+
+    Readers always get the last loaded list; once it is older than ``ttl``
+    a refresh is started in the background and stale data is served until
+    it completes. Only the very first read waits for the backend.
+
+    ``by_id`` and ``by_name`` index the current list, so conversations can
+    keep just a server id and resolve it here.
+    """
+
+    def __init__(self, loader, ttl=300):
+        self._loader = loader
+        self.ttl = ttl
+        self.servers = []
+        self.by_id = {}
+        self.by_name = {}
+        self.version = 0
+        self.updated_at = None
+        self._refresh_task = None
+        self._loop_task = None
+
+    @property
+    def is_stale(self):
+        return self.updated_at is None or time.monotonic() - self.updated_at > self.ttl
+
+    async def get(self):
+        """Return the cached server list, refreshing it if needed"""
+        if self.updated_at is None:
+            await self.refresh()
+        elif self.is_stale:
+            self._schedule_refresh()
+        return self.servers
+
+    async def refresh(self):
+        """Reload the list now, joining a refresh that is already running"""
+        task = self._schedule_refresh()
+        await asyncio.shield(task)
+        return self.servers
+
+    def _schedule_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._load())
+            self._refresh_task.add_done_callback(self._log_failure)
+        return self._refresh_task
+
+    async def _load(self):
+        servers = await self._loader()
+        self.servers = servers
+        self.by_id = {server['id']: server for server in servers}
+        self.by_name = {server['server_name']: server for server in servers}
+        self.version += 1
+        self.updated_at = time.monotonic()
+        logger.debug(f"Server catalogue refreshed: {len(servers)} servers, version {self.version}")
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error refreshing server catalogue: {task.exception()}")
+
+    def start(self, interval):
+        """Start periodic background refreshes"""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.ensure_future(self._run(interval))
+
+    async def stop(self):
+        for task in (self._loop_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._loop_task = None
+
+    async def _run(self, interval):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Already logged by the done callback, keep serving stale data
+                pass
+            await asyncio.sleep(interval)
@@ -0,0 +1,80 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import datetime
+from utils.api import iter_pages
+
+# dataset -> (backend list, CSV columns)
+DATASETS = {
+    "users": ("/users/", ("id", "telegram_id", "username", "first_name", "is_active")),
+    "keys": ("/keys/", (
+        "id", "user_id", "user_telegram_id", "server_name", "server_location",
+        "name", "traffic_used", "traffic_limit", "expiration_date", "is_active",
+    )),
+}
+FORMATS = ("csv", "jsonl")
+
+# Access URLs are credentials and stay out of reports
+EXCLUDED_FIELDS = frozenset({"access_url"})
+
+# Telegram bots can upload documents up to 50 MB
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+
+def export_filename(dataset, fmt, compress):
+    suffix = ".gz" if compress else ""
+    return f"{dataset}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}{suffix}"
+
+
+def _csv_writer(text, columns):
+    writer = csv.DictWriter(text, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    return writer.writerow
+
+
+def _jsonl_writer(text):
+    def write(item):
+        text.write(json.dumps({k: v for k, v in item.items() if k not in EXCLUDED_FIELDS}, ensure_ascii=False))
+        text.write("\n")
+    return write
+
+
+async def export_dataset(dataset, fmt="csv", compress=False, on_progress=None):
+    """Stream a backend list page by page into a temporary file.
+
+    Only one page is held in memory at a time. Calls ``on_progress(rows)``
+    after every page. Returns (file positioned at 0, rows written, size in
+    bytes); the caller closes the file.
+    """
+    path, columns = DATASETS[dataset]
+    # A real file object: before Python 3.11 SpooledTemporaryFile is not an IOBase,
+    # so neither TextIOWrapper nor aiogram's InputFile accept it
+    file = tempfile.TemporaryFile()
+    raw = gzip.GzipFile(fileobj=file, mode="wb") if compress else file
+    # utf-8-sig so spreadsheet apps detect the encoding of Cyrillic names
+    text = io.TextIOWrapper(raw, encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="")
+    write = _csv_writer(text, columns) if fmt == "csv" else _jsonl_writer(text)
+    rows = 0
+
+    try:
+        async for page in iter_pages(path):
+            for item in page:
+                write(item)
+            rows += len(page)
+            if on_progress is not None:
+                await on_progress(rows)
+
+        # Finish the text/gzip layers without closing the file underneath
+        text.flush()
+        text.detach()
+        if compress:
+            raw.close()
+    except BaseException:
+        file.close()
+        raise
+
+    size = file.tell()
+    file.seek(0)
+    return file, rows, size
@@ -0,0 +1,328 @@
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from urllib.parse import quote
+from aiogram.utils.exceptions import TelegramAPIError
+from resources.messages import ALERT_TRAFFIC, ALERT_TRAFFIC_EXHAUSTED, ALERT_EXPIRY
+from utils.api import iter_pages, invalidate_user_keys
+from utils.broadcast import UNREACHABLE_ERRORS
+from utils.metrics import registry
+from utils.render import format_date, format_traffic
+from utils.sender import bulk_sending
+
+logger = logging.getLogger(__name__)
+
+key_sync_seconds = registry.histogram(
+    "key_sync_seconds", "Duration of one key sync pass", buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+key_sync_changes = registry.counter("key_sync_changed_keys_total", "Keys added or changed by key sync")
+key_alerts = registry.counter("key_alerts_total", "Traffic and expiry notifications sent to users")
+
+# What the index keeps per key; a key is reprocessed only when this changes
+KeyState = namedtuple("KeyState", "owner name server_name traffic_used traffic_limit expiration_date is_active")
+
+
+def parse_timestamp(value):
+    """Parse a backend ISO timestamp into unix time (naive values are UTC)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        logger.warning(f"Unparseable timestamp from backend: {value!r}")
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def parse_thresholds(value):
+    """Parse "0.8,1.0" into a sorted tuple of traffic fractions"""
+    return tuple(sorted(float(part) for part in value.split(",") if part.strip()))
+
+
+class KeySync:
+    """Keeps a local index of all VPN keys and alerts their owners.
+
+    Every ``interval`` seconds the key list is pulled incrementally: with
+    ``use_cursor`` only keys updated since the newest ``updated_at`` seen
+    are requested; otherwise every page is fetched and diffed against the
+    index by comparing a small per-key tuple. Only added or changed keys
+    are checked against the traffic thresholds.
+
+    Expiry warnings are kept in a heap ordered by the time they are due
+    and fired by a timer, so nothing is rescanned while waiting. Alerts
+    already sent are saved to ``state_path`` and not repeated after a
+    restart.
+    """
+
+    def __init__(self, bot, state_path, interval=300, traffic_thresholds=(0.8, 1.0),
+                 expiry_warning=3 * 86400, use_cursor=False, concurrency=10):
+        self.bot = bot
+        self.state_path = state_path
+        self.interval = interval
+        self.traffic_thresholds = tuple(traffic_thresholds)
+        self.expiry_warning = expiry_warning
+        self.use_cursor = use_cursor
+        self.concurrency = concurrency
+
+        # key id -> KeyState
+        self.keys = {}
+        # key id -> [traffic thresholds passed, expires_at already warned about]
+        self.alerts = {}
+        # (alert at, key id, expires_at), stale entries are skipped when popped
+        self._deadlines = []
+        self._cursor = None
+
+        self._pending = []
+        self._dirty = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._tasks = []
+
+    # Persistence
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return
+
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        self.alerts = {int(key_id): alert for key_id, alert in state.get("alerts", {}).items()}
+        self._cursor = state.get("cursor")
+
+    def _save(self):
+        if not self._dirty:
+            return
+
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"alerts": self.alerts, "cursor": self._cursor}, f)
+        os.replace(tmp_path, self.state_path)
+        self._dirty = False
+
+    # Sync
+
+    async def sync(self):
+        """Pull key changes from the backend and send the resulting alerts"""
+        with key_sync_seconds.time():
+            if self.use_cursor and self._cursor is not None and self.keys:
+                changed = await self._sync_since(self._cursor)
+            else:
+                changed = await self._sync_full()
+
+        key_sync_changes.inc(changed)
+        logger.debug(f"Key sync: {changed} changed, {len(self.keys)} indexed")
+        await self._flush()
+        return changed
+
+    async def _sync_full(self):
+        changed = 0
+        seen = set()
+
+        async for page in iter_pages("/keys/"):
+            for key in page:
+                seen.add(key["id"])
+                changed += self._apply(key)
+
+        # Keys gone from the backend
+        for key_id in self.keys.keys() - seen:
+            self._remove(key_id)
+
+        return changed
+
+    async def _sync_since(self, cursor):
+        changed = 0
+        async for page in iter_pages(f"/keys/?updated_since={quote(cursor)}"):
+            for key in page:
+                changed += self._apply(key)
+        return changed
+
+    def _apply(self, key):
+        """Index one key from the backend, return 1 if it was new or changed"""
+        updated_at = key.get("updated_at")
+        if updated_at and (self._cursor is None or updated_at > self._cursor):
+            self._cursor = updated_at
+            self._dirty = True
+
+        key_id = key["id"]
+        state = KeyState(
+            owner=key.get("user_telegram_id"),
+            name=key.get("name", ""),
+            server_name=key.get("server_name", ""),
+            traffic_used=key.get("traffic_used") or 0,
+            traffic_limit=key.get("traffic_limit") or 0,
+            expiration_date=key.get("expiration_date"),
+            is_active=key.get("is_active", True),
+        )
+
+        previous = self.keys.get(key_id)
+        if previous == state:
+            return 0
+
+        self.keys[key_id] = state
+        if previous is not None and state.owner is not None:
+            # Cached key lists of the owner are outdated now
+            invalidate_user_keys(state.owner)
+
+        self._check_traffic(key_id, state)
+        self._schedule_expiry(key_id, state)
+        return 1
+
+    def _remove(self, key_id):
+        del self.keys[key_id]
+        if self.alerts.pop(key_id, None) is not None:
+            self._dirty = True
+
+    # Alerts
+
+    def _alert_state(self, key_id):
+        return self.alerts.get(key_id) or [0, None]
+
+    def _check_traffic(self, key_id, state):
+        if not state.is_active or state.traffic_limit <= 0 or state.owner is None:
+            return
+
+        passed = bisect.bisect_right(self.traffic_thresholds, state.traffic_used / state.traffic_limit)
+        alert = self._alert_state(key_id)
+        if passed == alert[0]:
+            return
+
+        if passed > alert[0]:
+            threshold = self.traffic_thresholds[passed - 1]
+            template = ALERT_TRAFFIC_EXHAUSTED if threshold >= 1 else ALERT_TRAFFIC
+            self._pending.append(("traffic", state.owner, template.format(
+                name=state.name,
+                server_name=state.server_name,
+                percent=round(threshold * 100),
+                traffic=format_traffic(state.traffic_used, state.traffic_limit),
+            )))
+
+        # Going down (limit raised, traffic reset) re-arms the thresholds
+        self.alerts[key_id] = [passed, alert[1]]
+        self._dirty = True
+
+    def _schedule_expiry(self, key_id, state):
+        # Parsed only here, for new or changed keys
+        expires_at = parse_timestamp(state.expiration_date)
+        if not state.is_active or expires_at is None or state.owner is None:
+            return
+        if self._alert_state(key_id)[1] == expires_at:
+            return
+
+        alert_at = expires_at - self.expiry_warning
+        if not self._deadlines or alert_at < self._deadlines[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._deadlines, (alert_at, key_id, expires_at))
+
+        # Changed keys leave stale entries behind; rebuild when they dominate
+        if len(self._deadlines) > 2 * len(self.keys) + 1024:
+            self._deadlines = [entry for entry in self._deadlines if self._is_current(*entry)]
+            heapq.heapify(self._deadlines)
+
+    def _is_current(self, alert_at, key_id, expires_at):
+        state = self.keys.get(key_id)
+        return (
+            state is not None and state.is_active and parse_timestamp(state.expiration_date) == expires_at
+            and self._alert_state(key_id)[1] != expires_at
+        )
+
+    def _collect_due(self, now):
+        while self._deadlines and self._deadlines[0][0] <= now:
+            alert_at, key_id, expires_at = heapq.heappop(self._deadlines)
+            if not self._is_current(alert_at, key_id, expires_at):
+                continue
+
+            alert = self._alert_state(key_id)
+            self.alerts[key_id] = [alert[0], expires_at]
+            self._dirty = True
+
+            if expires_at <= now:
+                # Already expired, a warning is pointless
+                continue
+
+            state = self.keys[key_id]
+            self._pending.append(("expiry", state.owner, ALERT_EXPIRY.format(
+                name=state.name,
+                server_name=state.server_name,
+                expiration=format_date(state.expiration_date),
+                days=math.ceil((expires_at - now) / 86400),
+            )))
+
+    async def _notify(self, semaphore, kind, chat_id, text):
+        async with semaphore:
+            try:
+                await self.bot.send_message(chat_id, text)
+                key_alerts.inc(kind=kind)
+            except UNREACHABLE_ERRORS:
+                pass
+            except TelegramAPIError as e:
+                logger.warning(f"Key alert to {chat_id} failed: {e}")
+
+    async def _flush(self):
+        """Send queued alerts with bulk priority and save what was sent"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, []
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            with bulk_sending():
+                for start in range(0, len(pending), self.concurrency * 10):
+                    await asyncio.gather(*(
+                        self._notify(semaphore, *alert) for alert in pending[start:start + self.concurrency * 10]
+                    ))
+
+            self._save()
+
+    # Background tasks
+
+    def start(self):
+        self.load()
+        self._tasks = [asyncio.ensure_future(self._run()), asyncio.ensure_future(self._run_timer())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._save()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error syncing keys: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _run_timer(self):
+        """Sleep until the earliest expiry warning is due (or an earlier one is added)"""
+        while True:
+            self._wakeup.clear()
+            timeout = self._deadlines[0][0] - time.time() if self._deadlines else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._collect_due(time.time())
+            if self._pending:
+                try:
+                    await self._flush()
+                except Exception as e:
+                    logger.error(f"Error sending key alerts: {e}")
+
+    def stats(self):
+        return {
+            "keys": len(self.keys),
+            "deadlines": len(self._deadlines),
+            "cursor": self._cursor,
+        }
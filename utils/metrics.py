@@ -0,0 +1,267 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import logging
+import time
+from aiohttp import web
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.dispatcher.storage import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.values = {}
+
+    def set(self, value, **labels):
+        self.values[_labels_key(labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            # The function returns a number or a {labels dict items tuple: value} mapping
+            result = self.function()
+            values = result if isinstance(result, dict) else {(): result}
+        else:
+            values = self.values
+        for key, value in values.items():
+            yield self.name, key, value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count], sum
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self, key):
+        """Return count, mean and approximate p50/p99 for one label set"""
+        counts, total = self.values[key]
+        count = sum(counts)
+        return {
+            "count": count,
+            "avg": total / count if count else 0.0,
+            "p50": self._quantile(counts, count, 0.5),
+            "p99": self._quantile(counts, count, 0.99),
+        }
+
+    def summaries(self):
+        """Yield (labels, summary) for every label set"""
+        for key in list(self.values):
+            yield dict(key), self.summary(key)
+
+    def _quantile(self, counts, count, q):
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return 0.0
+
+    def samples(self):
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", key + (("le", bound),), cumulative
+            yield f"{self.name}_sum", key, total
+            yield f"{self.name}_count", key, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation):
+        return self._add(Counter(name, documentation))
+
+    def gauge(self, name, documentation, function=None):
+        return self._add(Gauge(name, documentation, function))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, buckets))
+
+    def render(self):
+        """Render all metrics in Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, key, value in metric.samples():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_seconds = registry.histogram("bot_handler_seconds", "Message handler latency")
+handler_errors = registry.counter("bot_handler_errors_total", "Exceptions raised by handlers")
+backend_seconds = registry.histogram("backend_request_seconds", "Backend API call latency")
+qr_render_seconds = registry.histogram("qr_render_seconds", "QR code render time")
+fsm_storage_ops = registry.counter("fsm_storage_operations_total", "FSM storage operations")
+loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds", "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+# Name of the handler processing the current update, read when it raises
+_handler_name = contextvars.ContextVar('metrics_handler_name', default='unknown')
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Records per-handler latency and error counts"""
+
+    async def on_process_message(self, message, data):
+        # Button presses all go through ButtonRouter.dispatch; report the routed handler
+        handler = data.get('button_handler') or current_handler.get()
+        name = getattr(handler, '__name__', 'unknown')
+        _handler_name.set(name)
+        data['_metrics_handler'] = name
+        data['_metrics_started'] = time.perf_counter()
+
+    async def on_post_process_message(self, message, results, data):
+        started = data.get('_metrics_started')
+        if started is not None:
+            handler_seconds.observe(time.perf_counter() - started, handler=data['_metrics_handler'])
+
+    async def on_pre_process_error(self, update, exception, data):
+        handler_errors.inc(handler=_handler_name.get(), exception=type(exception).__name__)
+
+
+class MeteredStorage(BaseStorage):
+    """FSM storage wrapper counting operations by type"""
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def close(self):
+        await self.storage.close()
+
+    async def wait_closed(self):
+        await self.storage.wait_closed()
+
+    async def get_state(self, **kwargs):
+        fsm_storage_ops.inc(op="get_state")
+        return await self.storage.get_state(**kwargs)
+
+    async def get_data(self, **kwargs):
+        fsm_storage_ops.inc(op="get_data")
+        return await self.storage.get_data(**kwargs)
+
+    async def set_state(self, **kwargs):
+        fsm_storage_ops.inc(op="set_state")
+        return await self.storage.set_state(**kwargs)
+
+    async def set_data(self, **kwargs):
+        fsm_storage_ops.inc(op="set_data")
+        return await self.storage.set_data(**kwargs)
+
+    async def update_data(self, **kwargs):
+        fsm_storage_ops.inc(op="update_data")
+        return await self.storage.update_data(**kwargs)
+
+    async def reset_state(self, **kwargs):
+        fsm_storage_ops.inc(op="reset_state")
+        return await self.storage.reset_state(**kwargs)
+
+    def has_bucket(self):
+        return self.storage.has_bucket()
+
+    async def get_bucket(self, **kwargs):
+        fsm_storage_ops.inc(op="get_bucket")
+        return await self.storage.get_bucket(**kwargs)
+
+    async def set_bucket(self, **kwargs):
+        fsm_storage_ops.inc(op="set_bucket")
+        return await self.storage.set_bucket(**kwargs)
+
+    async def update_bucket(self, **kwargs):
+        fsm_storage_ops.inc(op="update_bucket")
+        return await self.storage.update_bucket(**kwargs)
+
+
+async def monitor_loop_lag(interval=1.0):
+    """Measure how late the event loop wakes up a sleeping task"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(max(0.0, time.perf_counter() - started - interval))
+
+
+async def metrics_view(request: web.Request):
+    """aiohttp handler serving the registry in Prometheus text format"""
+    return web.Response(text=registry.render(), headers={"Content-Type": "text/plain; version=0.0.4"})
+
+
+async def start_metrics_server(host, port):
+    """Serve /metrics on its own port (used in polling mode)"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from config import KEYS_CACHE_TTL
+from utils.api import get_user_keys, server_catalogue
+
+logger = logging.getLogger(__name__)
+
+# telegram_id -> running prefetch, so repeated taps don't stack requests
+_tasks = {}
+
+
+def prefetch_user_context(telegram_id, keys=True):
+    """Warm the user's keys and the server catalogue in the background.
+
+    Called from entry points (/start, /vpn) so the next button press reads
+    from the short-lived keys cache instead of waiting for the backend.
+    Errors are only logged; the handler that needs the data will retry.
+    """
+    if KEYS_CACHE_TTL <= 0 or telegram_id in _tasks:
+        return
+
+    task = asyncio.ensure_future(_prefetch(telegram_id, keys))
+    _tasks[telegram_id] = task
+    task.add_done_callback(lambda t: _tasks.pop(telegram_id, None))
+
+
+async def _prefetch(telegram_id, keys):
+    jobs = [server_catalogue.get()]
+    if keys:
+        jobs.append(get_user_keys(telegram_id, fresh=True))
+
+    for result in await asyncio.gather(*jobs, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.debug(f"Prefetch for {telegram_id} failed: {result}")
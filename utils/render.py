@@ -0,0 +1,126 @@
+"""Prebuilt keyboards and message templates used on every reply"""
+from aiogram import types
+
+GB = 1024 ** 3
+
+NO_EXPIRATION = "Бессрочно"
+UNLIMITED = "Безлимитно"
+
+
+class FrozenKeyboard(types.ReplyKeyboardMarkup):
+    """Reply keyboard built once at import time and serialised once.
+
+    aiogram calls ``to_python`` for every message the markup is attached
+    to; here the result is computed in the constructor and reused. The
+    keyboard cannot be changed afterwards.
+    """
+
+    def __init__(self, rows, resize_keyboard=True):
+        super().__init__(
+            keyboard=[[types.KeyboardButton(text) for text in row] for row in rows],
+            resize_keyboard=resize_keyboard,
+        )
+        self._python = super().to_python()
+
+    def to_python(self):
+        return self._python
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Prebuilt keyboards are immutable")
+
+    add = row = insert = _immutable
+
+
+def format_gb(value):
+    return f"{(value or 0) / GB:.2f} GB"
+
+
+def format_traffic(used, limit):
+    return f"{format_gb(used)} / {format_gb(limit) if limit and limit > 0 else UNLIMITED}"
+
+
+def format_date(value):
+    """Cut an ISO timestamp down to YYYY-MM-DD"""
+    return value.split('T', 1)[0] if value else NO_EXPIRATION
+
+
+def _key_fields(key):
+    return {
+        'name': key['name'],
+        'server_name': key['server_name'],
+        'server_location': key['server_location'],
+        'expiration': format_date(key.get('expiration_date')),
+        'traffic': format_traffic(key.get('traffic_used', 0), key.get('traffic_limit', 0)),
+        'status': 'Активен' if key['is_active'] else 'Неактивен',
+        'access_url': key.get('access_url', ''),
+    }
+
+
+# Templates are compiled once into bound str.format methods
+
+_PROFILE_HEADER = "🔑 Ваши VPN ключи:\n\n"
+
+_profile_entry = (
+    "🔸 {name}\n"
+    "📍 Сервер: {server_name} ({server_location})\n"
+    "📅 Истекает: {expiration}\n"
+    "📊 Трафик: {traffic}\n"
+    "🔗 Статус: {status}\n\n"
+).format
+
+_key_caption = (
+    "🔑 VPN ключ: {name}\n"
+    "📍 Сервер: {server_name} ({server_location})\n"
+    "📅 Истекает: {expiration}\n"
+    "📊 Трафик: {traffic}\n\n"
+    "🔗 Конфигурация:\n"
+    "`{access_url}`"
+).format
+
+_key_confirmation = (
+    "Вы выбрали сервер: {server_name} ({server_location})\n\n"
+    "Будет создан VPN ключ со следующими параметрами:\n"
+    "- Трафик: {traffic_limit_gb} GB\n"
+    "- Срок действия: {expiration_days} дней\n\n"
+    "Подтвердить создание ключа?"
+).format
+
+_key_created = (
+    "✅ <b>VPN ключ успешно создан!</b>\n\n"
+    "📍 <b>Сервер:</b> {server_name} ({server_location})\n"
+    "📅 <b>Срок действия:</b> {expiration_days} дней\n"
+    "📊 <b>Трафик:</b> {traffic_limit_gb} GB\n\n"
+    "🔑 <b>Конфигурация:</b>\n"
+    "Ссылка <b>на конфигурацию:</b> <code>{access_url}</code>\n\n"
+    "Отсканируйте QR-код или скопируйте конфигурацию для настройки VPN-клиента."
+).format
+
+
+def render_profile(keys):
+    """Profile message listing all of the user's keys"""
+    return _PROFILE_HEADER + "".join(_profile_entry(**_key_fields(key)) for key in keys)
+
+
+def render_key_caption(key):
+    """Markdown caption shown under a key's QR code"""
+    return _key_caption(**_key_fields(key))
+
+
+def render_key_confirmation(server, traffic_limit_gb, expiration_days):
+    return _key_confirmation(
+        server_name=server['server_name'],
+        server_location=server['server_location'],
+        traffic_limit_gb=traffic_limit_gb,
+        expiration_days=expiration_days,
+    )
+
+
+def render_key_created(server, access_url, traffic_limit_gb, expiration_days):
+    """HTML caption sent with the QR code of a new key"""
+    return _key_created(
+        server_name=server['server_name'],
+        server_location=server['server_location'],
+        access_url=access_url,
+        traffic_limit_gb=traffic_limit_gb,
+        expiration_days=expiration_days,
+    )
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from config import REPLICA_PATH
+from utils.api import iter_users, iter_keys, server_catalogue
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Access URLs are credentials and are not copied to disk
+_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, telegram_id INTEGER, username TEXT COLLATE NOCASE, first_name TEXT, is_active INTEGER
+);
+CREATE TABLE keys (
+    id INTEGER PRIMARY KEY, user_id INTEGER, user_telegram_id INTEGER, server_name TEXT, server_location TEXT,
+    name TEXT, traffic_used INTEGER, traffic_limit INTEGER, expiration_date TEXT, is_active INTEGER
+);
+CREATE TABLE servers (
+    id INTEGER PRIMARY KEY, server_name TEXT, server_location TEXT, active INTEGER
+);
+"""
+
+# Created after the bulk insert, which is faster than maintaining them row by row
+_INDEXES = """
+CREATE INDEX users_telegram_id ON users (telegram_id);
+CREATE INDEX users_username ON users (username);
+CREATE INDEX keys_user_telegram_id ON keys (user_telegram_id);
+CREATE INDEX keys_server_name ON keys (server_name, is_active);
+CREATE INDEX keys_is_active ON keys (is_active);
+"""
+
+_USER_COLUMNS = ("id", "telegram_id", "username", "first_name", "is_active")
+_KEY_COLUMNS = (
+    "id", "user_id", "user_telegram_id", "server_name", "server_location",
+    "name", "traffic_used", "traffic_limit", "expiration_date", "is_active",
+)
+_SERVER_COLUMNS = ("id", "server_name", "server_location", "active")
+
+
+def _rows(items, columns):
+    return [tuple(item.get(column) for column in columns) for item in items]
+
+
+def _insert(db, table, columns, rows):
+    placeholders = ", ".join("?" * len(columns))
+    db.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+
+class Replica:
+    """Read-only local copy of backend users, keys and servers.
+
+    Admin searches and counts are answered from SQLite with indexes on
+    telegram_id, username, server_name and is_active instead of paging
+    through the backend. ``sync()`` loads everything into a new database
+    and swaps it in whole, so readers never see a half-written copy and a
+    failed sync keeps the previous one. With a file path the copy survives
+    restarts.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.updated_at = None
+        self.counts = {}
+        self._db = None
+        self._sync_lock = asyncio.Lock()
+        self._task = None
+
+        if path != ':memory:' and os.path.exists(path):
+            self._db = self._connect(path)
+            self.updated_at = os.path.getmtime(path)
+
+    @property
+    def ready(self):
+        return self._db is not None
+
+    @staticmethod
+    def _connect(path):
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        return db
+
+    async def sync(self):
+        """Reload the copy from the backend"""
+        async with self._sync_lock:
+            started = time.perf_counter()
+            users = [user async for user in iter_users()]
+            keys = [key async for key in iter_keys()]
+            servers = list(await server_catalogue.get())
+
+            loop = asyncio.get_running_loop()
+            db = await loop.run_in_executor(None, self._build, users, keys, servers)
+
+            old, self._db = self._db, db
+            if old is not None:
+                old.close()
+
+            self.updated_at = time.time()
+            self.counts = {"users": len(users), "keys": len(keys), "servers": len(servers)}
+            logger.info(f"Replica synced in {time.perf_counter() - started:.1f}s: {self.counts}")
+            return self.counts
+
+    def _build(self, users, keys, servers):
+        in_memory = self.path == ':memory:'
+        target = self.path if in_memory else f"{self.path}.tmp"
+        if not in_memory and os.path.exists(target):
+            os.remove(target)
+
+        db = self._connect(target)
+        db.executescript(_SCHEMA)
+        with db:
+            _insert(db, "users", _USER_COLUMNS, _rows(users, _USER_COLUMNS))
+            _insert(db, "keys", _KEY_COLUMNS, _rows(keys, _KEY_COLUMNS))
+            _insert(db, "servers", _SERVER_COLUMNS, _rows(servers, _SERVER_COLUMNS))
+        db.executescript(_INDEXES)
+
+        if in_memory:
+            return db
+
+        db.close()
+        # Readers still hold the old file open; replacing it is safe on POSIX
+        os.replace(target, self.path)
+        return self._connect(self.path)
+
+    def _query(self, sql, params=()):
+        if self._db is None:
+            return []
+        return [dict(row) for row in self._db.execute(sql, params)]
+
+    # Queries
+
+    def find_users(self, query, limit=10):
+        """Find users by Telegram id, backend id or username prefix"""
+        query = query.strip().lstrip('@')
+        if query.isdigit():
+            return self._query(
+                "SELECT * FROM users WHERE telegram_id = ? OR id = ? LIMIT ?", (int(query), int(query), limit)
+            )
+        # LIKE 'prefix%' is served by the NOCASE username index
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return self._query(
+            "SELECT * FROM users WHERE username LIKE ? ESCAPE '\\' ORDER BY username LIMIT ?", (f"{escaped}%", limit)
+        )
+
+    def user_keys(self, telegram_id):
+        return self._query("SELECT * FROM keys WHERE user_telegram_id = ? ORDER BY id", (telegram_id,))
+
+    def server_keys(self, server_name, active_only=False):
+        if active_only:
+            return self._query(
+                "SELECT * FROM keys WHERE server_name = ? AND is_active = 1 ORDER BY id", (server_name,)
+            )
+        return self._query("SELECT * FROM keys WHERE server_name = ? ORDER BY id", (server_name,))
+
+    def key_counts(self):
+        """Return [(server_name, active keys, all keys)] for every server"""
+        rows = self._query(
+            "SELECT server_name, SUM(is_active) AS active, COUNT(*) AS total FROM keys "
+            "GROUP BY server_name ORDER BY server_name"
+        )
+        return [(row["server_name"], row["active"] or 0, row["total"]) for row in rows]
+
+    def active_key_count(self):
+        rows = self._query("SELECT COUNT(*) AS count FROM keys WHERE is_active = 1")
+        return rows[0]["count"] if rows else 0
+
+    # Background refresh
+
+    def reload(self):
+        """Reopen the file if another process has synced it since it was opened"""
+        if self.path == ':memory:' or not os.path.exists(self.path):
+            return False
+
+        mtime = os.path.getmtime(self.path)
+        if self._db is not None and self.updated_at is not None and mtime <= self.updated_at:
+            return False
+
+        old, self._db = self._db, self._connect(self.path)
+        if old is not None:
+            old.close()
+        self.updated_at = mtime
+        return True
+
+    def start(self, interval, follow=False):
+        """Sync every ``interval`` seconds; with ``follow`` only pick up syncs made by another process"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._follow(interval) if follow else self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def _run(self, interval):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error syncing replica: {e}")
+            await asyncio.sleep(interval)
+
+    async def _follow(self, interval):
+        # The file is replaced whole, so checking its mtime now and then is enough
+        while True:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error reloading replica: {e}")
+            await asyncio.sleep(min(interval, 30))
+
+
+replica = Replica(REPLICA_PATH)
+
+registry.gauge("replica_age_seconds", "Seconds since the admin replica was last synced",
+               lambda: time.time() - replica.updated_at if replica.updated_at else -1)
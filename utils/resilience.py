@@ -0,0 +1,122 @@
+import random
+import time
+
+
+class BackendUnavailable(Exception):
+    """The VPN backend could not be reached or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Fails fast after repeated backend failures.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``recovery_timeout`` seconds. Then a single probe call
+    is let through (half-open): success closes the breaker, failure opens
+    it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probe_started = None
+
+    def allow(self):
+        """Return True if a call may be attempted now"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+
+        if self.state == self.CLOSED:
+            return True
+
+        # One probe at a time; a probe that never reported back is replaced
+        if self.state == self.HALF_OPEN and (
+            self._probe_started is None or time.monotonic() - self._probe_started >= self.recovery_timeout
+        ):
+            self._probe_started = time.monotonic()
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "open_for": round(time.monotonic() - self.opened_at, 1) if self.state != self.CLOSED else 0,
+        }
+
+
+class RetryBudget:
+    """Caps retries at a fraction of regular traffic.
+
+    Every request deposits ``ratio`` of a token and every retry withdraws a
+    whole one, so during an outage retries add at most ``ratio`` extra load.
+    ``min_per_second`` tokens are added over time so a quiet bot can still
+    retry occasionally.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, capacity=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """Take a token for one retry, return False if the budget is spent"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self):
+        self._refill()
+        return {"tokens": round(self.tokens, 2), "exhausted": self.exhausted}
+
+
+def backoff_delay(attempt, base=0.2, cap=2.0):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_timeouts(value):
+    """Parse "endpoint=seconds,endpoint=seconds" into a dict"""
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, _, seconds = item.partition('=')
+        timeouts[endpoint.strip()] = float(seconds)
+    return timeouts
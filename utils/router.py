@@ -0,0 +1,58 @@
+import inspect
+import logging
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.filters import Filter
+from config import ADMIN_IDS
+
+logger = logging.getLogger(__name__)
+
+
+def _accepted_kwargs(handler):
+    """Return the keyword arguments ``handler`` takes besides the message, None if it takes any"""
+    # signature() follows __wrapped__, so decorated handlers are inspected as written
+    parameters = list(inspect.signature(handler).parameters.values())[1:]
+    if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters):
+        return None
+    return frozenset(
+        parameter.name for parameter in parameters
+        if parameter.kind in (parameter.POSITIONAL_OR_KEYWORD, parameter.KEYWORD_ONLY)
+    )
+
+
+class ButtonRouter(Filter):
+    """Routes reply keyboard button presses with one dict lookup.
+
+    Handlers are added per exact button text; the router is then registered
+    as a single message handler, so matching costs the same however many
+    buttons the menus have. Admin-only routes are skipped for other users,
+    letting the message fall through to later handlers.
+    """
+
+    def __init__(self):
+        # button text -> (handler, accepted keyword arguments, admin_only)
+        self.routes = {}
+        self.admin_ids = frozenset(ADMIN_IDS)
+
+    def add(self, text, handler, admin_only=False):
+        if text in self.routes:
+            raise ValueError(f"Button {text!r} is already routed to {self.routes[text][0].__name__}")
+        self.routes[text] = (handler, _accepted_kwargs(handler), admin_only)
+
+    async def check(self, message: types.Message):
+        route = self.routes.get(message.text)
+        if route is None:
+            return False
+        if route[2] and message.from_user.id not in self.admin_ids:
+            return False
+        # Exposed to middlewares (metrics) and to dispatch() below
+        return {'button_handler': route[0], 'button_kwargs': route[1]}
+
+    async def dispatch(self, message: types.Message, **data):
+        # Like aiogram, pass on only the data (state, filter results) the handler asks for
+        handler, accepted = data['button_handler'], data['button_kwargs']
+        if accepted is not None:
+            data = {key: value for key, value in data.items() if key in accepted}
+        return await handler(message, **data)
+
+    def register(self, dp: Dispatcher):
+        dp.register_message_handler(self.dispatch, self)
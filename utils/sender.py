@@ -0,0 +1,307 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import multiprocessing
+import time
+from aiogram import Bot
+from aiogram.bot import api
+from aiogram.utils.exceptions import RetryAfter
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+send_priority = contextvars.ContextVar('send_priority', default=PRIORITY_INTERACTIVE)
+
+# Bot API methods that count against Telegram's flood limits
+RATE_LIMITED_METHODS = {
+    api.Methods.SEND_MESSAGE,
+    api.Methods.SEND_PHOTO,
+    api.Methods.SEND_MEDIA_GROUP,
+    api.Methods.SEND_DOCUMENT,
+    api.Methods.FORWARD_MESSAGE,
+    api.Methods.COPY_MESSAGE,
+    api.Methods.EDIT_MESSAGE_TEXT,
+    api.Methods.EDIT_MESSAGE_CAPTION,
+    api.Methods.EDIT_MESSAGE_REPLY_MARKUP,
+}
+
+
+@contextlib.contextmanager
+def bulk_sending():
+    """Send everything inside the block with bulk (lowest) priority"""
+    token = send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available, without taking it"""
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+    def reserve(self):
+        """Take a token now, possibly on credit, and return how long to wait for it"""
+        self.consume()
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def debt(self):
+        """Seconds until the bucket is out of debt (reservations and penalties)"""
+        self._refill()
+        return max(0.0, -self.tokens / self.rate)
+
+    def penalize(self, seconds):
+        """Make the next token available no earlier than ``seconds`` from now"""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket kept in shared memory, so several processes draw from one budget.
+
+    Create it in the parent process and pass it to the workers as a process
+    argument. Relies on time.monotonic() being the same clock in every
+    process, which holds on one host.
+    """
+
+    def __init__(self, rate, capacity, context=None):
+        self.rate = rate
+        self.capacity = capacity
+        context = context or multiprocessing.get_context("spawn")
+        # tokens, updated; guarded by the array's (reentrant) lock
+        self._state = context.Array("d", (capacity, time.monotonic()))
+
+    @property
+    def tokens(self):
+        return self._state[0]
+
+    @tokens.setter
+    def tokens(self, value):
+        self._state[0] = value
+
+    @property
+    def updated(self):
+        return self._state[1]
+
+    @updated.setter
+    def updated(self, value):
+        self._state[1] = value
+
+    def delay(self):
+        with self._state.get_lock():
+            return super().delay()
+
+    def consume(self):
+        with self._state.get_lock():
+            super().consume()
+
+    def reserve(self):
+        with self._state.get_lock():
+            return super().reserve()
+
+    def debt(self):
+        with self._state.get_lock():
+            return super().debt()
+
+    def penalize(self, seconds):
+        with self._state.get_lock():
+            super().penalize(seconds)
+
+
+class SendScheduler:
+    """Paces outgoing Telegram calls under a global and a per-chat rate limit.
+
+    Each call first waits for its chat's bucket (in its own task, so a busy
+    chat never blocks others), then queues for a global token. Global
+    tokens go to the waiting call with the lowest priority value first.
+    ``RetryAfter`` replies pause the chat and retry the call; they also
+    hold back all bulk calls for that long, since 429s usually come in
+    bot-wide waves and bulk traffic would keep hitting them, while
+    interactive replies go on.
+
+    ``global_bucket`` replaces the global limit, e.g. with a
+    SharedTokenBucket when several processes send for the same bot.
+    """
+
+    # Buckets idle this long (past any penalty) are full again and can be dropped
+    CHAT_IDLE = 60
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, max_retries=3, global_bucket=None):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = global_bucket or TokenBucket(global_rate, global_rate)
+        self._chats = TTLCache(maxsize=100000, ttl=self.CHAT_IDLE)
+        self._bulk_paused_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        # Don't drop a bucket that still carries a flood control penalty
+        self._chats.set(chat_id, bucket, ttl=self.CHAT_IDLE + bucket.debt())
+        return bucket
+
+    def _flood_control(self, chat_id, seconds):
+        if chat_id is not None:
+            bucket = self._chat_bucket(chat_id)
+            bucket.penalize(seconds)
+            self._chats.set(chat_id, bucket, ttl=self.CHAT_IDLE + bucket.debt())
+
+        self._bulk_paused_until = max(self._bulk_paused_until, time.monotonic() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def submit(self, chat_id, call, priority=None):
+        """Run ``call()`` once both rate limits allow it and return its result"""
+        if priority is None:
+            priority = send_priority.get()
+
+        if chat_id is not None:
+            await asyncio.sleep(self._chat_bucket(chat_id).reserve())
+
+        attempt = 0
+        while True:
+            await self._acquire_global(priority)
+            try:
+                result = await call()
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                attempt += 1
+                self.retried += 1
+                logger.warning(f"Flood control for chat {chat_id}, retrying in {e.timeout}s")
+                self._flood_control(chat_id, e.timeout)
+                await asyncio.sleep(e.timeout)
+            except Exception:
+                self.failed += 1
+                raise
+            else:
+                self.sent += 1
+                return result
+
+    async def _acquire_global(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        self._wakeup.set()
+
+        await future
+
+    async def _dispatch(self):
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Only bulk calls are waiting (they sort last) and flood control holds them
+            bulk_pause = self._bulk_paused_until - time.monotonic()
+            if self._waiters[0][0] >= PRIORITY_BULK and bulk_pause > 0:
+                self._wakeup.clear()
+                try:
+                    # An interactive call or a new penalty wakes us up early
+                    await asyncio.wait_for(self._wakeup.wait(), bulk_pause)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._global.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Caller was cancelled while waiting
+                continue
+
+            self._global.consume()
+            future.set_result(None)
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def stats(self):
+        """Queue depth per priority and send counters"""
+        depth = {}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[priority] = depth.get(priority, 0) + 1
+        return {
+            "queue_depth": depth,
+            "chats": len(self._chats),
+            "bulk_paused": round(max(0.0, self._bulk_paused_until - time.monotonic()), 1),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+def _rewind(files):
+    """Rewind uploaded files so a retried request sends them again"""
+    for value in (files or {}).values():
+        file = getattr(value, 'file', value)
+        if hasattr(file, 'seek'):
+            file.seek(0)
+
+
+class ThrottledBot(Bot):
+    """Bot whose sending methods go through a SendScheduler"""
+
+    def __init__(self, *args, scheduler: SendScheduler = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or SendScheduler()
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if method not in RATE_LIMITED_METHODS:
+            return await super().request(method, data, files, **kwargs)
+
+        send = functools.partial(super().request, method, data, files, **kwargs)
+
+        async def call():
+            _rewind(files)
+            return await send()
+
+        return await self.scheduler.submit((data or {}).get('chat_id'), call)
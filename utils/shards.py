@@ -0,0 +1,219 @@
+import asyncio
+import collections
+import logging
+import multiprocessing
+import queue
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot import api
+from utils.cache import TTLCache
+from utils.webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Put on a worker queue to make the worker finish its updates and exit
+STOP = None
+
+
+def chat_key(update):
+    """Return the chat id a raw update belongs to (user id or update id as a fallback)"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        sender = value.get("from") or value.get("user")
+        if sender:
+            return sender["id"]
+    return update.get("update_id", 0)
+
+
+def shard_of(update, shards):
+    # Plain modulo: the same chat lands on the same worker in every process and after restarts
+    return chat_key(update) % shards
+
+
+class ShardRouter:
+    """Front side of sharded mode: hands raw updates to worker queues.
+
+    Updates are routed by chat id, so all updates of a chat go to one
+    worker in the order they were received. Queues are bounded; when a
+    worker falls behind, polling waits for room, while webhook deliveries
+    are refused with 503 right away so Telegram retries them later.
+    Updates already routed (redelivered by Telegram) are dropped by
+    update id.
+    """
+
+    def __init__(self, queues, seen_ttl=600):
+        self.queues = queues
+        self.routed = [0] * len(queues)
+        self.rejected = 0
+        self.duplicates = 0
+        self._seen = TTLCache(maxsize=100000, ttl=seen_ttl)
+
+    async def route(self, update, block=True):
+        """Put ``update`` on its worker's queue.
+
+        Returns False if the queue is full and ``block`` is false; the
+        update is not routed then. Duplicates count as routed.
+        """
+        update_id = update.get("update_id")
+        if update_id is not None and self._seen.get(update_id):
+            self.duplicates += 1
+            return True
+
+        index = shard_of(update, len(self.queues))
+        target = self.queues[index]
+        try:
+            target.put_nowait(update)
+        except queue.Full:
+            if not block:
+                self.rejected += 1
+                return False
+            await asyncio.get_running_loop().run_in_executor(None, target.put, update)
+
+        if update_id is not None:
+            self._seen.set(update_id, True)
+        self.routed[index] += 1
+        return True
+
+    def stop(self, timeout=5):
+        for target in self.queues:
+            try:
+                target.put(STOP, timeout=timeout)
+            except queue.Full:
+                # The worker is stuck or gone; it is terminated by the caller
+                target.cancel_join_thread()
+
+    async def poll(self, bot: Bot, timeout=30):
+        """Long-poll getUpdates and route the raw results without parsing them into objects"""
+        offset = None
+        while True:
+            try:
+                updates = await bot.request(api.Methods.GET_UPDATES, {"offset": offset, "timeout": timeout})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error getting updates: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for update in updates:
+                await self.route(update)
+                offset = update["update_id"] + 1
+
+    def create_webhook_app(self, path, secret_token=None):
+        """Build an aiohttp app that routes webhook updates to the workers"""
+        app = web.Application()
+
+        async def handle_update(request: web.Request):
+            if secret_token and request.headers.get(SECRET_HEADER) != secret_token:
+                return web.Response(status=403)
+
+            try:
+                update = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+
+            # Never wait for room here: a slow answer makes Telegram deliver the update again
+            if not await self.route(update, block=False):
+                return web.Response(status=503, headers={"Retry-After": "1"})
+            return web.Response()
+
+        async def health(request: web.Request):
+            return web.json_response({
+                "status": "ok", "routed": self.routed,
+                "rejected": self.rejected, "duplicates": self.duplicates,
+            })
+
+        app.router.add_post(path, handle_update)
+        app.router.add_get("/healthz", health)
+        return app
+
+
+class ShardWorker:
+    """Worker side of sharded mode: feeds routed updates into a dispatcher.
+
+    Updates of different chats are processed concurrently, up to
+    ``max_in_flight`` at once; updates of one chat are processed one after
+    another in arrival order. Each update still gets its own task, because
+    aiogram caches the FSM state per task.
+    """
+
+    def __init__(self, dp: Dispatcher, source, max_in_flight=100):
+        self.dp = dp
+        self.source = source
+        self.max_in_flight = max_in_flight
+        self.processed = 0
+        # chat id -> updates waiting behind the one being processed
+        self._chats = {}
+        self._semaphore = None
+        self._idle = None
+
+    def _submit(self, update):
+        chat_id = chat_key(update)
+        waiting = self._chats.get(chat_id)
+        if waiting is not None:
+            waiting.append(update)
+            return
+
+        self._chats[chat_id] = collections.deque()
+        self._idle.clear()
+        asyncio.ensure_future(self._run_chat(chat_id, update))
+
+    async def _run_chat(self, chat_id, update):
+        waiting = self._chats[chat_id]
+        while True:
+            try:
+                await asyncio.ensure_future(self.dp.process_update(types.Update(**update)))
+            except Exception as e:
+                logger.error(f"Error processing update: {e}")
+            finally:
+                self.processed += 1
+                self._semaphore.release()
+
+            if not waiting:
+                break
+            update = waiting.popleft()
+
+        del self._chats[chat_id]
+        if not self._chats:
+            self._idle.set()
+
+    async def run(self):
+        """Process updates until STOP is received, then wait for the ones in flight"""
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        loop = asyncio.get_running_loop()
+
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+
+        while True:
+            await self._semaphore.acquire()
+            update = await loop.run_in_executor(None, self.source.get)
+            if update is STOP:
+                break
+            self._submit(update)
+
+        await self._idle.wait()
+
+
+def start_workers(target, count, *args, queue_size=1000):
+    """Start ``count`` processes running ``target(index, queue, count, *args)``.
+
+    Processes are spawned rather than forked, so no event loop, session or
+    thread of the front process leaks into the workers. They are not
+    daemonic, so a worker may start its own QR process pool.
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(queue_size) for _ in range(count)]
+    processes = [
+        context.Process(target=target, args=(index, queues[index], count) + args, name=f"shard-{index}")
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes, queues
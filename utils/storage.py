@@ -0,0 +1,247 @@
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import time
+import typing
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+from config import (
+    FSM_STORAGE, FSM_SQLITE_PATH, FSM_STATE_TTL, FSM_FLUSH_INTERVAL,
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD, REDIS_PREFIX, REDIS_POOL_SIZE,
+)
+from utils.metrics import MeteredStorage
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage persisted to a SQLite file.
+
+    Reads are served from an in-memory copy that is loaded row by row on
+    first access. Writes only touch that copy and mark the row dirty; a
+    background task writes dirty rows in one transaction every
+    ``flush_interval`` seconds (write-behind) and drops conversations that
+    have not been touched for ``ttl`` seconds.
+    """
+
+    # Clean rows idle for longer than this are evicted from memory
+    CACHE_IDLE = 300
+    # Seconds to wait for another connection's write lock
+    BUSY_TIMEOUT = 10
+
+    def __init__(self, path, ttl=None, flush_interval=1.0):
+        self.path = path
+        self.ttl = ttl or None
+        self.flush_interval = flush_interval
+
+        # Several worker processes may share the file in sharded mode:
+        # wait for their locks instead of failing, and let readers run alongside a writer
+        self._db = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        self._db.execute(f"PRAGMA busy_timeout = {int(self.BUSY_TIMEOUT * 1000)}")
+        if path != ':memory:':
+            self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "chat TEXT NOT NULL, user TEXT NOT NULL, state TEXT, data TEXT, bucket TEXT, "
+            "touched_at REAL NOT NULL, PRIMARY KEY (chat, user))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fsm_touched_at ON fsm (touched_at)")
+        self._db.commit()
+
+        self._rows = {}
+        self._dirty = set()
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return str(chat), str(user)
+
+    def _expired(self, touched_at):
+        return self.ttl is not None and touched_at < time.time() - self.ttl
+
+    def _row(self, chat, user):
+        key = self._key(chat, user)
+        row = self._rows.get(key)
+
+        if row is None:
+            found = self._db.execute(
+                "SELECT state, data, bucket, touched_at FROM fsm WHERE chat = ? AND user = ?", key
+            ).fetchone()
+            if found and not self._expired(found[3]):
+                row = {
+                    'state': found[0],
+                    'data': json.loads(found[1] or '{}'),
+                    'bucket': json.loads(found[2] or '{}'),
+                    'touched_at': found[3],
+                }
+            else:
+                row = {'state': None, 'data': {}, 'bucket': {}, 'touched_at': time.time()}
+            self._rows[key] = row
+
+        elif self._expired(row['touched_at']):
+            row.update(state=None, data={}, bucket={})
+            self._dirty.add(key)
+
+        return key, row
+
+    def _touch(self, key, row):
+        row['touched_at'] = time.time()
+        self._dirty.add(key)
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing FSM storage: {e}")
+
+    async def flush(self):
+        """Write dirty rows to disk and expire abandoned conversations"""
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, set()
+            upserts, deletes = [], []
+
+            for key in dirty:
+                row = self._rows.get(key)
+                if row is None:
+                    continue
+                if row['state'] is None and not row['data'] and not row['bucket']:
+                    deletes.append(key)
+                else:
+                    upserts.append(key + (
+                        row['state'], json.dumps(row['data']), json.dumps(row['bucket']), row['touched_at'],
+                    ))
+
+            expire_before = time.time() - self.ttl if self.ttl is not None else None
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write, upserts, deletes, expire_before)
+            except Exception:
+                # Keep the rows dirty (and in memory) so the next flush writes them
+                self._dirty |= dirty
+                raise
+
+            # Keep memory bounded: forget clean rows nobody used recently
+            idle_before = time.time() - self.CACHE_IDLE
+            for key in [key for key, row in self._rows.items()
+                        if key not in self._dirty and row['touched_at'] < idle_before]:
+                del self._rows[key]
+
+    def _write(self, upserts, deletes, expire_before):
+        with self._db:
+            if upserts:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO fsm (chat, user, state, data, bucket, touched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    upserts,
+                )
+            if deletes:
+                self._db.executemany("DELETE FROM fsm WHERE chat = ? AND user = ?", deletes)
+            if expire_before is not None:
+                self._db.execute("DELETE FROM fsm WHERE touched_at < ?", (expire_before,))
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def wait_closed(self):
+        self._db.close()
+
+    async def get_state(self, *, chat=None, user=None, default=None) -> typing.Optional[str]:
+        key, row = self._row(chat, user)
+        return row['state'] if row['state'] is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None) -> typing.Dict:
+        key, row = self._row(chat, user)
+        return copy.deepcopy(row['data']) if row['data'] else (default or {})
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key, row = self._row(chat, user)
+        row['state'] = self.resolve_state(state)
+        self._touch(key, row)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key, row = self._row(chat, user)
+        row['data'] = copy.deepcopy(data) if data else {}
+        self._touch(key, row)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        if data is None:
+            data = {}
+        key, row = self._row(chat, user)
+        row['data'].update(copy.deepcopy(data), **kwargs)
+        self._touch(key, row)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        await self.set_state(chat=chat, user=user, state=None)
+        if with_data:
+            await self.set_data(chat=chat, user=user, data={})
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None) -> typing.Dict:
+        key, row = self._row(chat, user)
+        return copy.deepcopy(row['bucket']) if row['bucket'] else (default or {})
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        key, row = self._row(chat, user)
+        row['bucket'] = copy.deepcopy(bucket) if bucket else {}
+        self._touch(key, row)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        if bucket is None:
+            bucket = {}
+        key, row = self._row(chat, user)
+        row['bucket'].update(copy.deepcopy(bucket), **kwargs)
+        self._touch(key, row)
+
+
+def create_storage():
+    """Build the FSM storage selected by FSM_STORAGE in config.py, counting its operations"""
+    return MeteredStorage(_create_backend())
+
+
+def _create_backend():
+    if FSM_STORAGE == 'sqlite':
+        return SQLiteStorage(FSM_SQLITE_PATH, ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL)
+
+    if FSM_STORAGE == 'redis':
+        try:
+            from redis.asyncio import BlockingConnectionPool
+        except ImportError:
+            raise RuntimeError("FSM_STORAGE=redis needs the redis package: pip install -r requirements.txt")
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+
+        # The default pool raises "Too many connections" under load; this one waits for a free connection
+        pool = BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD or None,
+            max_connections=REDIS_POOL_SIZE,
+            decode_responses=True,
+        )
+        storage = RedisStorage2(
+            connection_pool=pool,
+            prefix=REDIS_PREFIX,
+            state_ttl=FSM_STATE_TTL or None,
+            data_ttl=FSM_STATE_TTL or None,
+            bucket_ttl=FSM_STATE_TTL or None,
+        )
+        # Disconnect the pool on storage.close(), as the client does for pools it creates itself
+        storage._redis.auto_close_connection_pool = True
+        return storage
+
+    return MemoryStorage()
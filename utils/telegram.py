@@ -0,0 +1,60 @@
+import time
+from aiogram import types
+from aiogram.utils.exceptions import TelegramAPIError
+
+# Telegram rejects text messages longer than this
+MESSAGE_LIMIT = 4096
+
+
+async def _aiter(blocks):
+    if hasattr(blocks, "__aiter__"):
+        async for block in blocks:
+            yield block
+    else:
+        for block in blocks:
+            yield block
+
+
+async def answer_chunked(message: types.Message, header, blocks, limit=MESSAGE_LIMIT):
+    """Stream text blocks into as few messages as fit under Telegram's length limit.
+
+    ``blocks`` may be a regular or async iterable; only the message being
+    filled is kept in memory. Returns the number of blocks sent, nothing is
+    sent when there are none.
+    """
+    text = header
+    count = 0
+
+    async for block in _aiter(blocks):
+        block = block[:limit]
+        if text and len(text) + len(block) > limit:
+            await message.answer(text)
+            text = ""
+        text += block
+        count += 1
+
+    if count and text:
+        await message.answer(text)
+    return count
+
+
+def progress_editor(message: types.Message, render, interval):
+    """Return ``async update(value, force=False)`` that edits ``message`` to ``render(value)``.
+
+    Edits happen at most once per ``interval`` seconds unless forced. Failed
+    edits (text unchanged, message deleted, flood control) are ignored,
+    progress is best effort.
+    """
+    last_update = time.monotonic()
+
+    async def update(value, force=False):
+        nonlocal last_update
+        if not force and time.monotonic() - last_update < interval:
+            return
+        last_update = time.monotonic()
+        try:
+            await message.edit_text(render(value))
+        except TelegramAPIError:
+            pass
+
+    return update
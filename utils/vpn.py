@@ -1,10 +1,106 @@
+import asyncio
 import io
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import qrcode
 from PIL import Image
+from config import (
+    QR_CACHE_MAX_BYTES, QR_FILE_ID_CACHE_SIZE, QR_POOL, QR_WORKERS, QR_MAX_PENDING,
+    QR_ENCODER, QR_BOX_SIZE, QR_BORDER, QR_ERROR_CORRECTION,
+)
+from utils.cache import SizedLRUCache, TTLCache
+from utils.metrics import qr_render_seconds
 
+# access_url -> rendered PNG bytes
+qr_png_cache = SizedLRUCache(maxbytes=QR_CACHE_MAX_BYTES)
+# access_url -> Telegram file_id of an already uploaded QR photo
+qr_file_id_cache = TTLCache(maxsize=QR_FILE_ID_CACHE_SIZE)
+
+# Worker pool for rendering and the limit of renders queued on it
+_executor = None
+_pending = None
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        if QR_POOL == 'process':
+            _executor = ProcessPoolExecutor(max_workers=QR_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=QR_WORKERS, thread_name_prefix='qr')
+    return _executor
+
+
+def _get_pending():
+    global _pending
+
+    if _pending is None:
+        _pending = asyncio.Semaphore(QR_MAX_PENDING)
+    return _pending
+
+
+def shutdown_qr_pool():
+    """Stop the QR worker pool (called on bot shutdown)"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+ERROR_CORRECTION_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _render_qr_png_compact(access_url, box_size=QR_BOX_SIZE, border=QR_BORDER,
+                           error_correction=QR_ERROR_CORRECTION):
+    """Render QR code as a 1-bit grayscale PNG straight from the module matrix"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        border=border,
+    )
+    qr.add_data(access_url)
+    qr.make(fit=True)
+
+    # get_matrix() already includes the border, True means a dark module
+    matrix = qr.get_matrix()
+    size = len(matrix) * box_size
+    row_bytes = (size + 7) // 8
+
+    # Pack each matrix row into bits (1 = white), scaled by box_size
+    dark_bits, light_bits = "0" * box_size, "1" * box_size
+    padding = "0" * (row_bytes * 8 - size)
+    rows = bytearray()
+    for modules in matrix:
+        bits = "".join(dark_bits if dark else light_bits for dark in modules) + padding
+        line = b"\x00" + int(bits, 2).to_bytes(row_bytes, "big")
+        rows += line * box_size
+
+    header = struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(bytes(rows), 9))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def _render_qr_png(access_url):
+    """Render QR code PNG bytes for VPN configuration"""
+    if QR_ENCODER == 'compact':
+        return _render_qr_png_compact(access_url)
 
-def generate_vpn_qr_code(access_url):
-    """Generate QR code for VPN configuration"""
     # Create QR code instance
     qr = qrcode.QRCode(
         version=1,
@@ -23,6 +119,38 @@ def generate_vpn_qr_code(access_url):
     # Save image to bytes buffer
     buffer = io.BytesIO()
     img.save(buffer, format="PNG")
-    buffer.seek(0)
 
-    return buffer
\ No newline at end of file
+    return buffer.getvalue()
+
+
+async def render_vpn_qr_code(access_url):
+    """Return the QR code PNG for a VPN key, rendering it in the worker pool.
+
+    At most QR_MAX_PENDING renders are queued on the pool, further callers
+    wait for a free slot instead of piling work onto it.
+    """
+    png = qr_png_cache.get(access_url)
+
+    if png is None:
+        async with _get_pending():
+            loop = asyncio.get_running_loop()
+            with qr_render_seconds.time(encoder=QR_ENCODER):
+                png = await loop.run_in_executor(_get_executor(), _render_qr_png, access_url)
+        qr_png_cache.set(access_url, png)
+
+    return io.BytesIO(png)
+
+
+async def get_vpn_qr_photo(access_url):
+    """Return something to pass to answer_photo: a known file_id or the PNG buffer"""
+    file_id = qr_file_id_cache.get(access_url)
+    if file_id is not None:
+        return file_id
+
+    return await render_vpn_qr_code(access_url)
+
+
+def remember_qr_file_id(access_url, message):
+    """Store the file_id Telegram assigned to an uploaded QR photo"""
+    if message is not None and message.photo:
+        qr_file_id_cache.set(access_url, message.photo[-1].file_id)
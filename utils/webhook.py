@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def create_webhook_app(dp: Dispatcher, path, max_in_flight=100, secret_token=None,
+                       on_startup=None, on_shutdown=None):
+    """Build an aiohttp app that feeds Telegram webhook updates into ``dp``.
+
+    Updates are acknowledged with 200 as soon as they are parsed and are
+    processed in background tasks. At most ``max_in_flight`` updates are
+    processed at once; when the limit is reached further updates are
+    refused with 503 right away and Telegram delivers them again later.
+    Waiting for a slot instead would delay the answer until Telegram
+    gives up on it and redelivers an update that was in fact processed.
+    """
+    app = web.Application()
+    app['ready'] = False
+    app['in_flight'] = set()
+
+    async def handle_update(request: web.Request):
+        if secret_token and request.headers.get(SECRET_HEADER) != secret_token:
+            return web.Response(status=403)
+
+        try:
+            update = types.Update(**(await request.json()))
+        except ValueError:
+            return web.Response(status=400)
+
+        if app['semaphore'].locked():
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        # Doesn't wait, a slot is free
+        await app['semaphore'].acquire()
+
+        # Tasks copy the current context, so handlers see the right bot/dispatcher
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        task = asyncio.ensure_future(dp.process_update(update))
+        app['in_flight'].add(task)
+        task.add_done_callback(_finish)
+
+        return web.Response()
+
+    def _finish(task):
+        app['in_flight'].discard(task)
+        app['semaphore'].release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error processing update: {task.exception()}")
+
+    async def health(request: web.Request):
+        return web.json_response({"status": "ok"})
+
+    async def ready(request: web.Request):
+        if not app['ready']:
+            return web.json_response({"status": "starting"}, status=503)
+        return web.json_response({"status": "ready", "in_flight": len(app['in_flight'])})
+
+    async def startup(app: web.Application):
+        app['semaphore'] = asyncio.Semaphore(max_in_flight)
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        if on_startup is not None:
+            await on_startup(dp)
+        app['ready'] = True
+
+    async def shutdown(app: web.Application):
+        app['ready'] = False
+        if app['in_flight']:
+            await asyncio.wait(set(app['in_flight']), timeout=10)
+        if on_shutdown is not None:
+            await on_shutdown(dp)
+        session = await dp.bot.get_session()
+        await session.close()
+
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/readyz", ready)
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+
+    return app